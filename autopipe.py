@@ -1,63 +1,181 @@
 import os
-import yaml
-import subprocess
+import time
 import argparse
 import logging
 
+from src.dag_config import DAG_HASH_ENV, DagConfigError, load_dag_config
+from src.log_stream import stream_command
+from src.run_history import RUN_ID_ENV, start_run, finish_run, record_stage, skip_stage, list_runs, compare_runs, latency_stats, find_regressions
+
 # Configure logging to display information based on your needs
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s] - %(levelname)s - %(message)s', datefmt='%H:%M:%S')
+# Number of last output lines of a failed script repeated in its error message, its full output is streamed above it
+ERROR_TAIL_LINES = 20
 
 
-def run_script(script_path, input):
+def run_script(script_path, input, run_id=None, extra_args=None):
     """
-    Run a script and wait for it to complete
+    Run a script and wait for it to complete, streaming its output line by line and recording its duration and exit
+    status in the run history
 
     :param script_path: Path to the script to run
+    :param input: Input argument passed to the script
+    :param run_id: ID of the current run in the run history
+    :param extra_args: Optional list of additional arguments passed to the script
     """
-    result = subprocess.run(['python3', script_path, '-i', input], capture_output=True, text=True)
-    if result.returncode != 0:
-        logging.error(f"Error running {script_path}: {result.stderr}")
-        exit(result.returncode)
+    stage = os.path.splitext(os.path.basename(script_path))[0]
+    if stage == 'main':
+        stage = os.path.basename(os.path.dirname(script_path))
+
+    start = time.time()
+    # Unbuffered python output, so that each line is streamed as soon as it is written
+    returncode, tail = stream_command(['python3', '-u', script_path, '-i', input] + (extra_args or []), stage,
+                                      tail_lines=ERROR_TAIL_LINES)
+    record_stage(run_id, stage, time.time() - start, returncode)
+
+    if returncode != 0:
+        last_lines = "\n".join(tail)
+        logging.error(f"Error running {script_path} (exit status {returncode}), see its output above. "
+                      f"Last {len(tail)} lines:\n{last_lines}")
+        finish_run(run_id, returncode)
+        exit(returncode)
     else:
-        logging.info(f"{script_path} executed successfully: {result.stdout}")
+        logging.info(f"{script_path} executed successfully")
 
 
-def main(input_file):
+def main(input_file, resume=None, follow_logs=False):
     """
-    Run the kubeflow autopipe tool to build and deploy the pipeline
+    Run the kubeflow autopipe tool to build and deploy the pipeline. When resuming a failed run, the media is already
+    saved and the images already delivered, so only the pipeline manager is executed
 
     :param input_file: Path to the application_dag.yaml configuration file
+    :param resume: Name of the PVC of a failed run to resume, 'latest' for the last failed run
+    :param follow_logs: If True, follow the logs of the component pods while the pipeline runs
     """
+    # Parse and validate the configuration once, before any expensive work. The stages load the same validated
+    # configuration from the cache by its hash, even if the file is edited while the run is in progress
+    os.environ.pop(DAG_HASH_ENV, None)
+    try:
+        config = load_dag_config(input_file)
+    except DagConfigError as e:
+        logging.error(f"Invalid configuration file {input_file}: {e}")
+        exit(1)
+    os.environ[DAG_HASH_ENV] = config.file_hash
+
     if not os.path.exists('output'):
         os.makedirs('output')
 
-    with open(input_file, 'r') as file:
-        config = yaml.safe_load(file)
+    # Record the run in the run history, sharing its ID with the stages
+    input_media = config.input_media
+    run_id = start_run(input_file, input_media)
+    os.environ[RUN_ID_ENV] = str(run_id)
+    logging.info(f"Run {run_id} recorded in the run history")
 
-    # 1. Save media
-    logging.info("Save Media script, starting...\n")
-    input_media = config['System']['input_media']
-    run_script('src/save-media/main.py', input_media)
-
-    # 2. Download components
-    if 'repository' in config['System']:
-        logging.info("Download Components script, starting...\n")
-        run_script('download_components.py', input_file)
+    if resume:
+        # The images of the failed run are reused, a changed component has to be rebuilt before resuming
+        for stage in ('save-media', 'download_components', 'docker_build'):
+            skip_stage(run_id, stage)
+        logging.info("Resuming a failed run, skipping save media, download components and build docker images.")
     else:
-        logging.info("Repository not specified, skipping download components.")
+        # 1. Save media
+        logging.info("Save Media script, starting...\n")
+        run_script('src/save-media/main.py', input_media, run_id)
+
+        # 2. Download components
+        if config.repository:
+            logging.info("Download Components script, starting...\n")
+            run_script('download_components.py', input_file, run_id)
+        else:
+            logging.info("Repository not specified, skipping download components.")
 
-    # 3. Build Docker images
-    logging.info("Build Docker Image script, starting...\n")
-    run_script('docker_build.py', input_file)
+        # 3. Build Docker images
+        logging.info("Build Docker Image script, starting...\n")
+        run_script('docker_build.py', input_file, run_id)
 
     # 4. Pipeline manager
     logging.info("Pipeline Manager script, starting...\n")
-    run_script('src/pipeline_manager.py', input_file)
+    pipeline_args = (['--resume', resume] if resume else []) + (['--follow-logs'] if follow_logs else [])
+    run_script('src/pipeline_manager.py', input_file, run_id, pipeline_args)
+
+    finish_run(run_id, 0)
+
+
+def show_runs(limit):
+    """
+    Print the most recent runs recorded in the run history
+
+    :param limit: Maximum number of runs to print
+    """
+    print(f"{'RUN':>5}  {'STARTED':19}  {'DURATION':>9}  {'STATUS':>6}  {'IMAGE BYTES':>12}  {'OUTPUT BYTES':>12}  {'KFP RUN ID':36}  DAG HASH")
+    for run in list_runs(limit):
+        started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(run['started_at']))
+        duration = f"{run['finished_at'] - run['started_at']:.0f}s" if run['finished_at'] else '-'
+        status = run['exit_status'] if run['exit_status'] is not None else '-'
+        print(f"{run['id']:>5}  {started:19}  {duration:>9}  {status:>6}  {run['image_bytes']:>12}  {run['output_bytes']:>12}  "
+              f"{run['kfp_run_id'] or '-':36}  {(run['dag_hash'] or '-')[:12]}")
+
+
+def show_comparison(run_a, run_b):
+    """
+    Print the stage/task durations and the image changes between two runs
+
+    :param run_a: ID of the baseline run
+    :param run_b: ID of the run to compare against the baseline
+    """
+    durations, images = compare_runs(run_a, run_b)
+    print(f"{'STAGE/TASK':40}  {f'RUN {run_a}':>10}  {f'RUN {run_b}':>10}  {'DELTA':>8}")
+    for key, duration_a, duration_b in durations:
+        delta = f"{(duration_b - duration_a) / duration_a:+.0%}" if duration_a and duration_b else '-'
+        print(f"{key:40}  {duration_a or 0:>9.1f}s  {duration_b or 0:>9.1f}s  {delta:>8}")
+    for component, digest_a, digest_b in images:
+        print(f"image {component} changed: {digest_a or '-'} -> {digest_b or '-'}")
+
+
+def show_stats(last):
+    """
+    Print the p50 and p95 latency of each stage and task over the most recent successful runs
+
+    :param last: Number of most recent successful runs to take into account
+    """
+    print(f"{'STAGE/TASK':40}  {'RUNS':>4}  {'P50':>9}  {'P95':>9}")
+    for key, (samples, p50, p95) in sorted(latency_stats(last).items()):
+        print(f"{key:40}  {samples:>4}  {p50:>8.1f}s  {p95:>8.1f}s")
+
+
+def show_regressions(threshold):
+    """
+    Print the stages and tasks that slowed down compared to the previous successful runs
+
+    :param threshold: Ratio over the baseline median above which a duration is considered a slowdown
+    """
+    regressions = find_regressions(threshold)
+    if not regressions:
+        print("No slowdowns found")
+    for run_id, key, duration, median, changes in regressions:
+        cause = ", ".join(changes) if changes else "no component or template change"
+        print(f"run {run_id}: {key} took {duration:.1f}s, baseline {median:.1f}s ({duration / median:.1f}x) - {cause}")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("-i", "--input", required=True, help="path to application_dag.yaml configuration file")
+    parser.add_argument("-i", "--input", help="path to application_dag.yaml configuration file")
+    parser.add_argument("--resume", nargs='?', const='latest', metavar="PVC", help="resume a failed run from its kept PVC, the last failed run if PVC is not specified")
+    parser.add_argument("--follow-logs", action='store_true', help="follow the logs of the component pods while the pipeline runs")
+    parser.add_argument("--runs", type=int, metavar="N", help="list the last N runs recorded in the run history")
+    parser.add_argument("--compare", type=int, nargs=2, metavar=("RUN_A", "RUN_B"), help="compare two recorded runs")
+    parser.add_argument("--stats", type=int, metavar="N", help="show p50/p95 stage and task latency over the last N successful runs")
+    parser.add_argument("--regressions", type=float, nargs='?', const=1.2, metavar="RATIO", help="flag slowdowns above RATIO times the previous runs median (default 1.2)")
     args = vars(parser.parse_args())
 
-    main(args['input'])
+    if args['runs']:
+        show_runs(args['runs'])
+    elif args['compare']:
+        show_comparison(*args['compare'])
+    elif args['stats']:
+        show_stats(args['stats'])
+    elif args['regressions']:
+        show_regressions(args['regressions'])
+    elif args['input']:
+        main(args['input'], args['resume'], args['follow_logs'])
+    else:
+        parser.error("the following arguments are required: -i/--input")
@@ -1,35 +1,33 @@
 import os
-import yaml
+import re
+import json
+import functools
 import subprocess
 import argparse
 import logging
 from dotenv import load_dotenv
 
+from src.dag_config import load_dag_config
+from src.log_stream import stream_command
+from src.registry import load_registry_config, image_tag
+from src.run_history import current_run_id, update_run, record_image, add_bytes, file_checksum
+
+# Size units accepted in the build context and image size budgets
+SIZE_UNITS = {'B': 1, 'KB': 1000, 'MB': 1000 ** 2, 'GB': 1000 ** 3, 'KIB': 1024, 'MIB': 1024 ** 2, 'GIB': 1024 ** 3}
 # Configure logging to display information based on your needs
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s] - %(message)s', datefmt='%H:%M:%S')
 
 
-def load_dag_configuration(dag_path: str):
-    """
-    Load the yaml dag configuration file, to extract the required information
-
-    :param dag_path: The file path to the YAML configuration file
-    :return: List of component names
-    """
-    with open(dag_path, 'r') as file:
-        data = yaml.safe_load(file)
-        return data['System']['components']
-
-
-def register_login(username, password):
+def register_login(username, password, registry=''):
     """
     Login to Docker registry using provided credentials.
     This function constructs a Docker login command using the provided username and password, then executes it.
 
     :param username: Docker username
     :param password: Docker password
+    :param registry: Registry endpoint to login to, Docker Hub if empty
     """
-    login_command = f"echo {password} | docker login --username {username} --password-stdin"
+    login_command = f"echo {password} | docker login {registry} --username {username} --password-stdin"
     result = subprocess.run(login_command, shell=True, capture_output=True, text=True)
     if result.returncode == 0:
         logging.info("Successfully logged into Docker")
@@ -74,67 +72,368 @@ def generate_dockerfile(component, template_path, base_dir_path):
     return component_path
 
 
-def build_register_image(username, component, component_path):
+def generate_dockerignore(component_path, template_path):
+    """
+    Generate the .dockerignore file of a component from a template, to exclude version control leftovers, caches and
+    virtual environments from its build context. An existing .dockerignore defined by the component is kept.
+
+    :param component_path: Path to the directory of the component
+    :param template_path: Path to the .dockerignore template
+    """
+    dockerignore_path = os.path.join(component_path, '.dockerignore')
+    if os.path.exists(dockerignore_path):
+        return
+    if not os.path.exists(template_path):
+        logging.error(f"Template path '{template_path}' does not exist")
+        return
+    with open(template_path, 'r') as template_file:
+        template = template_file.read()
+    with open(dockerignore_path, 'w') as dockerignore:
+        dockerignore.write(template)
+
+
+def parse_size(size):
+    """
+    Convert a human-readable size into bytes
+
+    :param size: Size with an optional unit, e.g. '500MB', '2GiB', '1024'
+    :return: Size in bytes
+    """
+    size = size.strip().upper().replace(' ', '')
+    for unit in sorted(SIZE_UNITS, key=len, reverse=True):
+        if size.endswith(unit):
+            return int(float(size[:-len(unit)]) * SIZE_UNITS[unit])
+    return int(float(size))
+
+
+def format_size(size):
+    """
+    Convert a size in bytes into a human-readable string
+
+    :param size: Size in bytes
+    :return: Human-readable size, e.g. '1.2 GB'
+    """
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1000 or unit == 'GB':
+            return f"{size:.1f} {unit}" if unit != 'B' else f"{size} B"
+        size /= 1000
+
+
+def read_ignore_patterns(component_path):
+    """
+    Read the patterns of the .dockerignore file of a component
+
+    :param component_path: Path to the directory of the component
+    :return: List of patterns, in the order they are defined
+    """
+    dockerignore_path = os.path.join(component_path, '.dockerignore')
+    if not os.path.exists(dockerignore_path):
+        return []
+    with open(dockerignore_path, 'r') as dockerignore:
+        lines = [line.strip() for line in dockerignore]
+    return [line for line in lines if line and not line.startswith('#')]
+
+
+@functools.lru_cache(maxsize=None)
+def ignore_pattern_regex(pattern):
+    """
+    Convert a .dockerignore pattern into a regular expression matching the paths of the build context, following the
+    Docker rules: '*' and '?' never match '/', and a '**' segment matches any number of directories
+
+    :param pattern: The .dockerignore pattern, without the leading '!' and the surrounding '/'
+    :return: The compiled regular expression, to be matched against the whole path
+    """
+    segments = pattern.split('/')
+    regex = ''
+    for index, segment in enumerate(segments):
+        last = index == len(segments) - 1
+        if segment == '**':
+            regex += '.*' if last else '(?:[^/]*/)*'
+            continue
+        position = 0
+        while position < len(segment):
+            char = segment[position]
+            end = segment.find(']', position + 1) if char == '[' else -1
+            if char == '*':
+                regex += '[^/]*'
+            elif char == '?':
+                regex += '[^/]'
+            elif end != -1:
+                char_class = segment[position + 1:end]
+                regex += f"[{'^' + char_class[1:] if char_class.startswith(('!', '^')) else char_class}]"
+                position = end
+            elif char == '\\' and position + 1 < len(segment):
+                position += 1
+                regex += re.escape(segment[position])
+            else:
+                regex += re.escape(char)
+            position += 1
+        regex += '' if last else '/'
+    return re.compile(regex)
+
+
+def is_ignored(relative_path, patterns):
+    """
+    Check if a path of the build context is excluded by the .dockerignore patterns. The last matching pattern wins,
+    and patterns starting with '!' re-include the matching paths, as done by Docker.
+
+    :param relative_path: Path relative to the root of the build context, using '/' as separator
+    :param patterns: List of .dockerignore patterns
+    :return: True if the path is excluded from the build context
+    """
+    parts = relative_path.split('/')
+    # A path is excluded also when one of its parent directories is excluded
+    candidates = ['/'.join(parts[:index]) for index in range(1, len(parts) + 1)]
+    ignored = False
+    for pattern in patterns:
+        negate = pattern.startswith('!')
+        regex = ignore_pattern_regex(pattern.lstrip('!').strip('/'))
+        if any(regex.fullmatch(candidate) for candidate in candidates):
+            ignored = not negate
+    return ignored
+
+
+def check_context_size(component, component_path, budget, large_file_size):
     """
-    Build Docker image for a given component
+    Compute the size of the build context of a component, excluding the files ignored by its .dockerignore, and warn
+    if it exceeds the budget, listing the largest files it contains. Large files are reported but never excluded, since
+    they may be model weights loaded by the component at runtime.
 
-    :param username: Docker username used for tagging the image
+    :param component: Name of the component
+    :param component_path: Path to the directory of the component
+    :param budget: Maximum expected size of the build context, in bytes
+    :param large_file_size: Size above which a single file of the build context is reported, in bytes
+    :return: Size of the build context in bytes
+    """
+    patterns = read_ignore_patterns(component_path)
+    files = []
+    for root, dirs, filenames in os.walk(component_path):
+        relative_root = os.path.relpath(root, component_path).replace(os.sep, '/')
+        relative_root = '' if relative_root == '.' else relative_root + '/'
+        # Do not descend into excluded directories, unless a negated pattern could re-include part of them
+        if not any(pattern.startswith('!') for pattern in patterns):
+            dirs[:] = [d for d in dirs if not is_ignored(relative_root + d, patterns)]
+        for filename in filenames:
+            relative_path = relative_root + filename
+            if not is_ignored(relative_path, patterns):
+                files.append((os.path.getsize(os.path.join(root, filename)), relative_path))
+
+    large_files = ", ".join(f"{path} ({format_size(size)})" for size, path in sorted(files, reverse=True)
+                            if size > large_file_size)
+    if large_files:
+        logging.warning(f"Build context of {component} contains large files: {large_files}. If they are datasets or "
+                        f"checkpoints not needed at runtime, add them to its .dockerignore")
+
+    context_size = sum(size for size, _ in files)
+    if context_size > budget:
+        largest = ", ".join(f"{path} ({format_size(size)})" for size, path in sorted(files, reverse=True)[:5])
+        logging.warning(f"Build context of {component} is {format_size(context_size)}, over the budget of "
+                        f"{format_size(budget)}. Largest files: {largest}. Consider adding them to its .dockerignore")
+    else:
+        logging.info(f"Build context of {component} is {format_size(context_size)}")
+    return context_size
+
+
+def image_size_report(tag, component, budget):
+    """
+    Collect the size of the image of a component and of its layers, comparing it against the budget
+
+    :param tag: Tag of the built image
+    :param component: Name of the component
+    :param budget: Maximum expected size of the image, in bytes
+    :return: Dictionary with the image size, its budget and its layers, None if the image cannot be inspected
+    """
+    inspect_command = ["docker", "image", "inspect", "--format", "{{.Size}}", tag]
+    history_command = ["docker", "history", "--human=false", "--no-trunc", "--format", "{{.Size}}\t{{.CreatedBy}}", tag]
+    inspect_result = subprocess.run(inspect_command, capture_output=True, text=True)
+    history_result = subprocess.run(history_command, capture_output=True, text=True)
+    if inspect_result.returncode != 0 or history_result.returncode != 0:
+        logging.error(f"Failed to inspect image of {component}: {inspect_result.stderr or history_result.stderr}")
+        return None
+
+    layers = []
+    for line in history_result.stdout.splitlines():
+        size, _, created_by = line.partition('\t')
+        if int(size) > 0:
+            layers.append({'size': int(size), 'created_by': created_by.strip()})
+    return {
+        'component': component,
+        'image': tag,
+        'size': int(inspect_result.stdout.strip()),
+        'budget': budget,
+        'layers': sorted(layers, key=lambda layer: layer['size'], reverse=True)
+    }
+
+
+def log_size_report(report, report_path):
+    """
+    Log the size of each image against its budget, with its largest layers, and save the full report as JSON
+
+    :param report: List of image size reports, as returned by image_size_report
+    :param report_path: Path to the JSON file where the report is saved
+    """
+    for image in report:
+        status = "OVER BUDGET" if image['size'] > image['budget'] else "ok"
+        message = f"Image {image['image']}: {format_size(image['size'])} / {format_size(image['budget'])} budget - {status}"
+        if image['size'] > image['budget']:
+            logging.warning(message)
+            for layer in image['layers'][:3]:
+                logging.warning(f"    {format_size(layer['size']):>10}  {layer['created_by'][:100]}")
+        else:
+            logging.info(message)
+
+    os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+    with open(report_path, 'w') as report_file:
+        json.dump(report, report_file, indent=2)
+    logging.info(f"Image size report saved to {report_path}")
+
+
+def build_register_image(tag, component, component_path):
+    """
+    Build Docker image for a given component, streaming the build output line by line
+
+    :param tag: Tag of the image to build
     :param component: Name of the component for which to build the image
     :param component_path: Path to the directory of the component
+    :return: True if the image was built successfully
     """
-    tag = f"{username}/{component}:latest"
-    build_command = ["docker", "build", "-t", tag, "."]
-    result = subprocess.run(build_command, cwd=component_path, capture_output=True, text=True)
-    if result.returncode == 0:
+    build_command = ["docker", "build", "--progress=plain", "-t", tag, "."]
+    returncode, tail = stream_command(build_command, f"build {component}", cwd=component_path)
+    if returncode == 0:
         logging.info(f"Docker image for {component} built successfully")
     else:
-        logging.error(f"Failed to build Docker image for {component}: {result.stderr}")
+        last_lines = "\n".join(tail[-20:])
+        logging.error(f"Failed to build Docker image for {component}:\n{last_lines}")
+    return returncode == 0
 
 
-def push_to_hub(username, component):
+def push_to_registry(tag, component, registry):
     """
-    Push Docker image of the given component to Docker Hub
+    Push Docker image of the given component to a registry (Docker Hub, or the one defined in its tag)
 
-    :param username: Docker username used for tagging the image
-    :param component: Name of the component for which to build the image
+    :param tag: Tag of the image to push
+    :param component: Name of the component for which to push the image
+    :param registry: Name of the registry, used for logging
+    :return: True if the image was pushed successfully
     """
-    tag = f"{username}/{component}:latest"
     push_command = ["docker", "push", tag]
     result = subprocess.run(push_command, capture_output=True, text=True)
     if result.returncode == 0:
-        logging.info(f"Successfully pushed {component} to Docker Hub")
+        logging.info(f"Successfully pushed {component} to {registry}")
     else:
-        logging.error(f"Failed to push {component} to Docker Hub: {result.stderr}")
+        logging.error(f"Failed to push {component} to {registry}: {result.stderr}")
+    return result.returncode == 0
+
+
+def sideload_image(tag, component, tool, cluster_name):
+    """
+    Import Docker image of the given component directly into the container runtime of the nodes of a local cluster,
+    avoiding the round trip through a registry
+
+    :param tag: Tag of the image to import
+    :param component: Name of the component for which to import the image
+    :param tool: Tool managing the local cluster, one of: ['k3d', 'kind', 'minikube']
+    :param cluster_name: Name of the local cluster, the tool's default cluster if empty
+    :return: True if the image was imported successfully
+    """
+    if tool == 'k3d':
+        load_command = ["k3d", "image", "import", tag] + (["--cluster", cluster_name] if cluster_name else [])
+    elif tool == 'kind':
+        load_command = ["kind", "load", "docker-image", tag] + (["--name", cluster_name] if cluster_name else [])
+    else:
+        load_command = ["minikube", "image", "load", tag] + (["--profile", cluster_name] if cluster_name else [])
+    result = subprocess.run(load_command, capture_output=True, text=True)
+    if result.returncode == 0:
+        logging.info(f"Successfully side-loaded {component} into the cluster nodes with {tool}")
+    else:
+        logging.error(f"Failed to side-load {component} into the cluster nodes with {tool}: {result.stderr}")
+    return result.returncode == 0
+
+
+def deliver_image(registry_config, component):
+    """
+    Deliver Docker image of the given component to the cluster, using the configured delivery backend
+
+    :param registry_config: Image delivery configuration, as returned by load_registry_config
+    :param component: Name of the component for which to deliver the image
+    :return: True if the image was delivered successfully
+    """
+    tag = image_tag(registry_config, component)
+    if registry_config['backend'] == 'sideload':
+        return sideload_image(tag, component, registry_config['sideload_tool'], registry_config['cluster_name'])
+    if registry_config['backend'] == 'local':
+        return push_to_registry(tag, component, registry_config['endpoint'])
+    return push_to_registry(tag, component, 'Docker Hub')
 
 
-def main(base_dir_path: str, template_path: str, input_file: str):
+def record_pushed_image(run_id, tag, component):
     """
-    Main function to build and push Docker images for the components
+    Record the digest and size of the delivered image of a component in the run history
+
+    :param run_id: ID of the current run in the run history
+    :param tag: Tag of the delivered image
+    :param component: Name of the component
+    """
+    # The image ID is used as digest, since side-loaded images have no registry digest
+    inspect_command = ["docker", "image", "inspect", "--format", "{{.Id}} {{.Size}}", tag]
+    result = subprocess.run(inspect_command, capture_output=True, text=True)
+    if result.returncode != 0:
+        logging.error(f"Failed to inspect image of {component}: {result.stderr}")
+        return
+    digest, size = result.stdout.split()
+    record_image(run_id, component, digest)
+    add_bytes(run_id, image_bytes=int(size))
+
+
+def main(base_dir_path: str, template_path: str, dockerignore_template_path: str, report_path: str, input_file: str):
+    """
+    Main function to build Docker images for the components and deliver them to the cluster
 
     :param base_dir_path: Base directory path where component directories are located
     :param template_path: path to the Dockerfile template
+    :param dockerignore_template_path: path to the .dockerignore template
+    :param report_path: path to the JSON file where the image size report is saved
+    :param input_file: Path to the application_dag.yaml configuration file
     """
     # Load the components from the dag configuration file
-    components = load_dag_configuration(input_file)
+    components = load_dag_config(input_file).components
 
-    # Read credentials from .env file
+    # Read the image delivery configuration and credentials from .env file
+    registry_config = load_registry_config()
+    # Docker login, not needed when side-loading the images or pushing to an unauthenticated local registry
+    if registry_config['backend'] == 'dockerhub':
+        register_login(registry_config['username'], registry_config['password'])
+    elif registry_config['backend'] == 'local' and registry_config['username']:
+        register_login(registry_config['username'], registry_config['password'], registry_config['endpoint'])
+
+    # Read the build context and image size budgets from .env file
     load_dotenv()
-    register_username = os.getenv('REGISTER_USERNAME')
-    register_password = os.getenv('REGISTER_PASSWORD')
-    # Docker login
-    register_login(register_username, register_password)
+    context_budget = parse_size(os.getenv('BUILD_CONTEXT_BUDGET', '500MB'))
+    image_budget = parse_size(os.getenv('IMAGE_SIZE_BUDGET', '2GB'))
+    large_file_size = parse_size(os.getenv('LARGE_FILE_SIZE', '100MB'))
 
-    # Generate container for each component
+    # Generate container for each component, and for save_media component
+    component_paths = {}
     for component in components:
-        component_path = generate_dockerfile(component, template_path, base_dir_path)
-        build_register_image(register_username, component, component_path)
-    # Generate container for save_media component
-    build_register_image(register_username, 'save-media', 'src/save-media')
+        component_paths[component] = generate_dockerfile(component, template_path, base_dir_path)
+        generate_dockerignore(component_paths[component], dockerignore_template_path)
+    component_paths['save-media'] = 'src/save-media'
+    size_report = []
+    for component, component_path in component_paths.items():
+        check_context_size(component, component_path, context_budget, large_file_size)
+        tag = image_tag(registry_config, component)
+        if build_register_image(tag, component, component_path):
+            image_report = image_size_report(tag, component, image_budget)
+            if image_report:
+                size_report.append(image_report)
+    log_size_report(size_report, report_path)
 
-    # Push the containers to Docker Hub
-    for component in components:
-        push_to_hub(register_username, component)
-    push_to_hub(register_username, 'save-media')
+    # Deliver the containers to the cluster, recording the delivered images in the run history
+    run_id = current_run_id()
+    update_run(run_id, template_hash=file_checksum(template_path))
+    for component in components + ['save-media']:
+        if deliver_image(registry_config, component):
+            record_pushed_image(run_id, image_tag(registry_config, component), component)
 
     # Remove unused local docker images
     cleanup_untagged_images()
@@ -143,9 +442,11 @@ def main(base_dir_path: str, template_path: str, input_file: str):
 if __name__ == '__main__':
     base_dir_path = 'components'
     template_path = 'src/template/dockerfile.template'
+    dockerignore_template_path = 'src/template/dockerignore.template'
+    report_path = 'output/image_size_report.json'
 
     parser = argparse.ArgumentParser()
     parser.add_argument("-i", "--input", required=True, help="path to application_dag.yaml configuration file")
     args = vars(parser.parse_args())
 
-    main(base_dir_path, template_path, args['input'])
+    main(base_dir_path, template_path, dockerignore_template_path, report_path, args['input'])
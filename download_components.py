@@ -1,10 +1,11 @@
 import os
 import shutil
-import yaml
 import argparse
 import logging
 from git import Repo
 
+from src.dag_config import load_dag_config
+
 # Temporary directory for cloning the repository
 temp_dir = "./repo"
 # Directory name where components will be stored
@@ -13,18 +14,6 @@ components_dir = "./components"
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s] - %(message)s', datefmt='%H:%M:%S')
 
 
-def load_dag_configuration(dag_path: str):
-    """
-    Load the yaml dag configuration file, to extract the required information
-
-    :param dag_path: The file path to the YAML configuration file
-    :return: A tuple containing the repository URL and a list of component names
-    """
-    with open(dag_path, 'r') as file:
-        data = yaml.safe_load(file)
-        return data['System']['repository'], data['System']['components']
-
-
 def clone_repository(repo_url: str, local_path: str):
     """
     Clone a Git repository to a defined local path. If folder already exists, delete it to ensure a fresh clone of the repository
@@ -94,9 +83,9 @@ def main(input_file):
 
     :param input_file: Path to the application_dag.yaml configuration file
     """
-    repo_url, components = load_dag_configuration(input_file)
-    clone_repository(repo_url, temp_dir)
-    check_copy_components(temp_dir, components_dir, components)
+    config = load_dag_config(input_file)
+    clone_repository(config.repository, temp_dir)
+    check_copy_components(temp_dir, components_dir, config.components)
     clean_up(temp_dir)
 
 
@@ -0,0 +1,271 @@
+import os
+import re
+import json
+import yaml
+import hashlib
+import logging
+from dataclasses import dataclass, field, asdict
+from typing import Optional
+
+# Local directory where the validated configurations are cached, by hash of the configuration file
+CACHE_DIR = 'history/dag_cache'
+# Version of the cached content, to be increased when its format or the validation rules change, so that older cache
+# files are ignored
+CACHE_VERSION = 4
+# Maximum number of configurations kept in the cache, the least recently used ones are removed
+CACHE_SIZE = 20
+# Environment variable used to share the hash of the configuration validated by autopipe.py with the stages of the tool
+DAG_HASH_ENV = 'AUTOPIPE_DAG_HASH'
+# Name reserved for the component saving the input media into the PVC
+SAVE_MEDIA = 'save-media'
+# Component names are used as Docker image names, Kubernetes object names and Python identifiers of the Kubeflow
+# component functions, so only these characters are allowed and they must start with a letter
+COMPONENT_NAME_PATTERN = re.compile(r'^[a-z][a-z0-9]*(?:[._-][a-z0-9]+)*$')
+# Options accepted in the retry policy of a component
+RETRY_OPTIONS = {'num_retries': int, 'backoff_duration': str, 'backoff_factor': (int, float), 'backoff_max_duration': str}
+
+# Configurations already loaded by this process, by hash of the configuration file
+_loaded = {}
+
+
+class DagConfigError(ValueError):
+    """
+    Raised when the application_dag.yaml configuration file is not valid.
+    """
+
+
+@dataclass
+class DagConfig:
+    """
+    Parsed and validated content of the application_dag.yaml configuration file, shared by all the stages of the tool.
+    """
+    name: str
+    input_media: str
+    components: list
+    dependencies: list
+    repository: Optional[str] = None
+    retries: dict = field(default_factory=dict)
+    upstream: dict = field(default_factory=dict)
+    downstream: dict = field(default_factory=dict)
+    file_hash: str = ''
+
+    @property
+    def input_filename(self):
+        """Name of the input media file, as saved into the PVC"""
+        return os.path.basename(self.input_media)
+
+    @staticmethod
+    def identifier(component: str):
+        """Python identifier of a component, used as the name of its Kubeflow component function"""
+        return component.replace('-', '_').replace('.', '_')
+
+
+def _normalize_name(name, context: str):
+    # Surrounding whitespace is stripped, but the case is kept: names are also the component folders in the repository
+    # and Docker image names, so an uppercase name is rejected instead of silently pointing to another folder
+    if not isinstance(name, str) or not name.strip():
+        raise DagConfigError(f"Invalid component name {name!r} in {context}")
+    name = name.strip()
+    if not COMPONENT_NAME_PATTERN.match(name):
+        raise DagConfigError(f"Invalid component name '{name}' in {context}: it must start with a lowercase letter, "
+                             f"and only lowercase letters, digits, '.', '_' and '-' are allowed")
+    return name
+
+
+def _parse_dependencies(raw_dependencies, components: list):
+    if not isinstance(raw_dependencies, list):
+        raise DagConfigError("'dependencies' must be a list of [from, to, probability] entries")
+    dependencies = []
+    for entry in raw_dependencies:
+        if not isinstance(entry, list) or len(entry) not in (2, 3):
+            raise DagConfigError(f"Invalid dependency {entry!r}, expected [from, to, probability]")
+        this_component = _normalize_name(entry[0], f"dependency {entry!r}")
+        next_component = _normalize_name(entry[1], f"dependency {entry!r}")
+        probability = entry[2] if len(entry) == 3 else 1
+        for component in (this_component, next_component):
+            if component not in components:
+                raise DagConfigError(f"Dependency {entry!r} refers to '{component}', which is not listed in 'components'")
+        if this_component == next_component:
+            raise DagConfigError(f"Dependency {entry!r} connects '{this_component}' to itself")
+        if isinstance(probability, bool) or not isinstance(probability, (int, float)) or not 0 <= probability <= 1:
+            raise DagConfigError(f"Invalid probability in dependency {entry!r}, must be a number between 0 and 1")
+        dependencies.append((this_component, next_component, probability))
+    return dependencies
+
+
+def _parse_retries(raw_retries, components: list):
+    if raw_retries is None:
+        return {}
+    if not isinstance(raw_retries, dict):
+        raise DagConfigError("'retries' must map component names to their retry policy")
+    retries = {}
+    for name, policy in raw_retries.items():
+        component = _normalize_name(name, "'retries'")
+        if component not in components:
+            raise DagConfigError(f"Retry policy defined for '{component}', which is not listed in 'components'")
+        if not isinstance(policy, dict) or 'num_retries' not in policy:
+            raise DagConfigError(f"Retry policy of '{component}' must define at least 'num_retries'")
+        for option, value in policy.items():
+            if option not in RETRY_OPTIONS:
+                raise DagConfigError(f"Unknown retry option '{option}' for '{component}', must be one of: {list(RETRY_OPTIONS)}")
+            if isinstance(value, bool) or not isinstance(value, RETRY_OPTIONS[option]):
+                raise DagConfigError(f"Invalid value {value!r} for retry option '{option}' of '{component}'")
+        retries[component] = dict(policy)
+    return retries
+
+
+def _check_acyclic(components: list, downstream: dict):
+    # Kahn's algorithm: if not every component can be ordered, the remaining ones are part of a cycle
+    in_degree = {component: 0 for component in components}
+    for next_components in downstream.values():
+        for component in next_components:
+            in_degree[component] += 1
+    ready = [component for component, degree in in_degree.items() if degree == 0]
+    while ready:
+        for component in downstream[ready.pop()]:
+            in_degree[component] -= 1
+            if in_degree[component] == 0:
+                ready.append(component)
+    cycle = sorted(component for component, degree in in_degree.items() if degree > 0)
+    if cycle:
+        raise DagConfigError(f"Dependencies contain a cycle between: {cycle}")
+
+
+def parse_dag_config(data, file_hash: str = ''):
+    """
+    Validate the content of the configuration file and build the DagConfig object, with the component names stripped
+    of surrounding whitespace and the adjacency index of the dependencies
+
+    :param data: Content of the YAML configuration file, as loaded by yaml.safe_load
+    :param file_hash: Hash of the configuration file
+    :return: The validated DagConfig
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('System'), dict):
+        raise DagConfigError("The configuration must define a 'System' section")
+    system = data['System']
+
+    name = system.get('name')
+    if not isinstance(name, str) or not name.strip():
+        raise DagConfigError("'name' must be a non-empty string")
+
+    input_media = system.get('input_media')
+    if not isinstance(input_media, str) or not input_media.strip():
+        raise DagConfigError("'input_media' must be the local path of the input media file")
+    input_media = input_media.strip()
+
+    repository = system.get('repository')
+    if repository is not None and not isinstance(repository, str):
+        raise DagConfigError("'repository' must be the link to a Git repository")
+    repository = repository.strip() if repository and repository.strip() else None
+
+    raw_components = system.get('components')
+    if not isinstance(raw_components, list) or not raw_components:
+        raise DagConfigError("'components' must be a non-empty list of component names")
+    components = [_normalize_name(component, "'components'") for component in raw_components]
+    duplicates = sorted({component for component in components if components.count(component) > 1})
+    if duplicates:
+        raise DagConfigError(f"Components listed more than once: {duplicates}")
+    if SAVE_MEDIA in components:
+        raise DagConfigError(f"'{SAVE_MEDIA}' is reserved for the component saving the input media")
+    identifiers = [DagConfig.identifier(component) for component in components]
+    if len(set(identifiers)) != len(identifiers):
+        raise DagConfigError("Component names must stay unique when '-' and '.' are replaced by '_'")
+
+    dependencies = _parse_dependencies(system.get('dependencies') or [], components)
+    upstream = {component: [] for component in components}
+    downstream = {component: [] for component in components}
+    for this_component, next_component, _ in dependencies:
+        if next_component not in downstream[this_component]:
+            downstream[this_component].append(next_component)
+            upstream[next_component].append(this_component)
+    _check_acyclic(components, downstream)
+    for component in components:
+        if not upstream[component] and not downstream[component] and len(components) > 1:
+            logging.warning(f"Component '{component}' is not part of any dependency and will not be executed")
+
+    return DagConfig(
+        name=name.strip(),
+        input_media=input_media,
+        components=components,
+        dependencies=dependencies,
+        repository=repository,
+        retries=_parse_retries(system.get('retries'), components),
+        upstream=upstream,
+        downstream=downstream,
+        file_hash=file_hash
+    )
+
+
+def _cache_path(cache_dir: str, file_hash: str):
+    return os.path.join(cache_dir, f"{file_hash}.v{CACHE_VERSION}.json")
+
+
+def _read_cache(cache_dir: str, file_hash: str):
+    # A missing, corrupted or outdated cache entry is ignored
+    cache_path = _cache_path(cache_dir, file_hash)
+    try:
+        with open(cache_path, 'r') as cache_file:
+            cached = json.load(cache_file)
+        cached['dependencies'] = [tuple(dependency) for dependency in cached['dependencies']]
+        config = DagConfig(**cached)
+    except (OSError, ValueError, TypeError, KeyError):
+        return None
+    # Mark the entry as recently used, so that it is not pruned while a run uses it
+    os.utime(cache_path)
+    return config
+
+
+def _write_cache(cache_dir: str, config: DagConfig):
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(_cache_path(cache_dir, config.file_hash), 'w') as cache_file:
+        json.dump(asdict(config), cache_file, indent=2)
+    # Keep only the most recently used entries
+    entries = sorted((os.path.join(cache_dir, name) for name in os.listdir(cache_dir)), key=os.path.getmtime, reverse=True)
+    for entry in entries[CACHE_SIZE:]:
+        os.remove(entry)
+
+
+def load_dag_config(dag_path: str, cache_dir: str = CACHE_DIR):
+    """
+    Load the yaml dag configuration file and validate it. The validated configuration is cached by hash of the file, in
+    memory and on disk, together with the version of the cache format.
+    When the hash of the configuration validated at the start of the run is exported by autopipe.py, that exact
+    configuration is loaded from the cache instead of the file, so that every stage gets the same view of it even if
+    the file is edited while the run is in progress.
+
+    :param dag_path: The file path to the YAML configuration file
+    :param cache_dir: Directory where the validated configurations are cached
+    :return: The validated DagConfig
+    """
+    pinned_hash = os.getenv(DAG_HASH_ENV)
+    if pinned_hash:
+        if pinned_hash in _loaded:
+            return _loaded[pinned_hash]
+        config = _read_cache(cache_dir, pinned_hash)
+        if config is None:
+            raise DagConfigError(f"Configuration {pinned_hash} validated at the start of the run not found in "
+                                 f"'{cache_dir}'")
+        with open(dag_path, 'rb') as file:
+            if hashlib.sha256(file.read()).hexdigest() != pinned_hash:
+                logging.warning(f"'{dag_path}' changed since the start of the run, using the configuration validated "
+                                f"at the start of the run")
+        file_hash = pinned_hash
+    else:
+        with open(dag_path, 'rb') as file:
+            content = file.read()
+        file_hash = hashlib.sha256(content).hexdigest()
+        if file_hash in _loaded:
+            return _loaded[file_hash]
+        config = _read_cache(cache_dir, file_hash)
+        if config is None:
+            try:
+                data = yaml.safe_load(content)
+            except yaml.YAMLError as e:
+                raise DagConfigError(f"Failed to parse '{dag_path}': {e}") from e
+            config = parse_dag_config(data, file_hash)
+            _write_cache(cache_dir, config)
+
+    if not os.path.isfile(config.input_media):
+        raise DagConfigError(f"Input media '{config.input_media}' does not exist")
+    _loaded[file_hash] = config
+    return config
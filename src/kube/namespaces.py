@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import yaml
+import subprocess
+import logging
+
+# Namespace defined and used with deployKF, used when no namespaces configuration is provided
+DEFAULT_NAMESPACE = 'team-1'
+# Configuration file listing the namespaces where the pipeline runs can be placed, with their caps
+NAMESPACES_PATH = 'namespaces.yaml'
+# Prefix of the PVCs created for the pipeline runs, each of them corresponding to an active or resumable run
+PVC_PREFIX = 'mypipe-pvc-'
+# Label set on the PVCs kept by failed runs to resume them, which are not counted as active runs
+KEPT_LABEL = 'autopipe/kept'
+# Configure logging to display information based on your needs
+logging.basicConfig(level=logging.INFO, format='[%(asctime)s] - %(message)s', datefmt='%H:%M:%S')
+
+
+def parse_storage(quantity: str):
+    """
+    Convert a Kubernetes storage quantity into bytes
+
+    :param quantity: Storage quantity (e.g. '5Gi', '500M', '1073741824')
+    :return: The storage quantity in bytes
+    """
+    units = {'Ki': 1024, 'Mi': 1024 ** 2, 'Gi': 1024 ** 3, 'Ti': 1024 ** 4,
+             'k': 1000, 'K': 1000, 'M': 1000 ** 2, 'G': 1000 ** 3, 'T': 1000 ** 4}
+    quantity = str(quantity)
+    for suffix in sorted(units, key=len, reverse=True):
+        if quantity.endswith(suffix):
+            return int(float(quantity[:-len(suffix)]) * units[suffix])
+    return int(float(quantity))
+
+
+def load_namespaces(config_path: str = NAMESPACES_PATH):
+    """
+    Load the namespaces where the pipeline runs can be placed, with their optional caps on concurrent runs and storage
+
+    :param config_path: Path to the namespaces YAML configuration file
+    :return: List of dictionaries with the name, max_concurrent_runs and max_storage (in bytes) of each namespace
+    """
+    if not os.path.exists(config_path):
+        return [{'name': DEFAULT_NAMESPACE, 'max_concurrent_runs': None, 'max_storage': None}]
+
+    with open(config_path, 'r') as file:
+        data = yaml.safe_load(file) or {}
+    namespaces = []
+    for entry in data.get('namespaces') or []:
+        if isinstance(entry, str):
+            entry = {'name': entry}
+        max_storage = entry.get('max_storage')
+        namespaces.append({
+            'name': entry['name'],
+            'max_concurrent_runs': entry.get('max_concurrent_runs'),
+            'max_storage': parse_storage(max_storage) if max_storage else None
+        })
+    if not namespaces:
+        raise ValueError(f"No namespaces defined in '{config_path}'")
+    return namespaces
+
+
+def get_namespace_usage(namespace: str):
+    """
+    Retrieve how much of a namespace is used by the pipeline runs, and the free room left by its ResourceQuotas
+
+    :param namespace: Kubernetes namespace to inspect
+    :return: Dictionary with the number of active pipeline runs, the number of PVCs kept by failed runs, the storage
+             requested by all of them, and the storage and PVCs still allowed by the quotas (None if not limited),
+             None if the namespace cannot be inspected
+    """
+    pvc_result = subprocess.run(["kubectl", "get", "pvc", "-n", namespace, "-o", "json"], capture_output=True, text=True)
+    if pvc_result.returncode != 0:
+        logging.error(f"Failed to list PVCs of namespace {namespace}: {pvc_result.stderr}")
+        return None
+    pvcs = [pvc for pvc in json.loads(pvc_result.stdout).get('items', [])
+            if pvc['metadata']['name'].startswith(PVC_PREFIX)]
+    kept = [pvc for pvc in pvcs if pvc['metadata'].get('labels', {}).get(KEPT_LABEL) == 'true']
+    usage = {
+        'runs': len(pvcs) - len(kept),
+        'kept': len(kept),
+        'storage': sum(parse_storage(pvc['spec']['resources']['requests']['storage']) for pvc in pvcs),
+        'quota_storage_free': None,
+        'quota_pvcs_free': None
+    }
+
+    quota_result = subprocess.run(["kubectl", "get", "resourcequota", "-n", namespace, "-o", "json"], capture_output=True, text=True)
+    if quota_result.returncode != 0:
+        logging.warning(f"Failed to read ResourceQuotas of namespace {namespace}: {quota_result.stderr}")
+        return usage
+    for quota in json.loads(quota_result.stdout).get('items', []):
+        hard, used = quota.get('status', {}).get('hard', {}), quota.get('status', {}).get('used', {})
+        if 'requests.storage' in hard:
+            free = parse_storage(hard['requests.storage']) - parse_storage(used.get('requests.storage', '0'))
+            usage['quota_storage_free'] = free if usage['quota_storage_free'] is None else min(free, usage['quota_storage_free'])
+        if 'persistentvolumeclaims' in hard:
+            free = int(hard['persistentvolumeclaims']) - int(used.get('persistentvolumeclaims', '0'))
+            usage['quota_pvcs_free'] = free if usage['quota_pvcs_free'] is None else min(free, usage['quota_pvcs_free'])
+    return usage
+
+
+def namespace_headroom(namespace: dict, usage: dict, storage_size: int):
+    """
+    Compute the headroom of a namespace for a new run, as the smallest fraction of its caps and quotas that would still
+    be free after placing the run. The PVCs kept by failed runs do not count as concurrent runs, but still use storage.
+
+    :param namespace: Namespace configuration, as returned by load_namespaces
+    :param usage: Namespace usage, as returned by get_namespace_usage
+    :param storage_size: Storage requested by the PVC of the new run, in bytes
+    :return: Headroom between 0 and 1, None if the run does not fit in the namespace
+    """
+    ratios = [1.0]
+    if namespace['max_concurrent_runs'] is not None:
+        ratios.append((namespace['max_concurrent_runs'] - usage['runs'] - 1) / namespace['max_concurrent_runs'])
+    if namespace['max_storage'] is not None:
+        ratios.append((namespace['max_storage'] - usage['storage'] - storage_size) / namespace['max_storage'])
+    if usage['quota_storage_free'] is not None:
+        ratios.append((usage['quota_storage_free'] - storage_size) / max(usage['quota_storage_free'], 1))
+    if usage['quota_pvcs_free'] is not None:
+        ratios.append((usage['quota_pvcs_free'] - 1) / max(usage['quota_pvcs_free'], 1))
+
+    headroom = min(ratios)
+    return headroom if headroom >= 0 else None
+
+
+def rank_namespaces(storage_size: str, config_path: str = NAMESPACES_PATH):
+    """
+    Rank the configured namespaces where a new run fits, from the one with the most headroom
+
+    :param storage_size: Storage requested by the PVC of the new run (e.g. '5Gi')
+    :param config_path: Path to the namespaces YAML configuration file
+    :return: List of namespace names, empty if the run does not fit in any namespace, None if no namespace could be
+             inspected
+    """
+    size = parse_storage(storage_size)
+    candidates = []
+    inspected = False
+    for namespace in load_namespaces(config_path):
+        usage = get_namespace_usage(namespace['name'])
+        if usage is None:
+            continue
+        inspected = True
+        headroom = namespace_headroom(namespace, usage, size)
+        logging.info(f"Namespace {namespace['name']}: {usage['runs']} runs, {usage['kept']} PVCs kept by failed runs, "
+                     f"headroom {'none' if headroom is None else f'{headroom:.0%}'}")
+        if usage['kept'] and headroom is None:
+            logging.warning(f"Namespace {namespace['name']} is full, the PVCs kept by failed runs still use its storage "
+                            f"and quota: resume or delete them with 'kubectl delete pvc -n {namespace['name']} "
+                            f"-l {KEPT_LABEL}=true'")
+        if headroom is not None:
+            candidates.append((headroom, namespace['name']))
+    if not inspected:
+        return None
+    return [name for _, name in sorted(candidates, key=lambda candidate: candidate[0], reverse=True)]
+
+
+def wait_for_namespaces(storage_size: str, timeout: int = 3600, interval: int = 30, config_path: str = NAMESPACES_PATH):
+    """
+    Wait until at least one of the configured namespaces has room for a new run, so that batch runs queue up instead
+    of exhausting the quotas. The wait only goes on while the namespaces can be inspected and are full: if none of
+    them can be inspected, e.g. because the cluster is unreachable, there is nothing to wait for.
+
+    :param storage_size: Storage requested by the PVC of the new run (e.g. '5Gi')
+    :param timeout: Maximum number of seconds to wait
+    :param interval: Seconds to wait between two checks
+    :param config_path: Path to the namespaces YAML configuration file
+    :return: List of namespace names ranked by headroom, empty if none had room before the timeout or none could be
+             inspected
+    """
+    deadline = time.time() + timeout
+    while True:
+        ranked = rank_namespaces(storage_size, config_path)
+        if ranked is None:
+            logging.error("None of the configured namespaces could be inspected, check the cluster connection")
+            return []
+        if ranked or time.time() + interval > deadline:
+            return ranked
+        logging.info(f"No namespace has room for a new run, retrying in {interval} seconds...")
+        time.sleep(interval)
+
+
+def find_pvc_namespace(pvc_name: str, config_path: str = NAMESPACES_PATH):
+    """
+    Find which of the configured namespaces contains a PVC, e.g. to resume the run that used it
+
+    :param pvc_name: Name of the PVC
+    :param config_path: Path to the namespaces YAML configuration file
+    :return: Name of the namespace, None if the PVC is not found
+    """
+    for namespace in load_namespaces(config_path):
+        result = subprocess.run(["kubectl", "get", "pvc", pvc_name, "-n", namespace['name']], capture_output=True, text=True)
+        if result.returncode == 0:
+            return namespace['name']
+    return None
@@ -1,17 +1,28 @@
 import kfp
+import logging
 from .pipeline_auth import KFPClientManager
+from .namespaces import DEFAULT_NAMESPACE
 
-# Namespace defined and used with deployKF
-NAMESPACE = 'team-1'
+# Maximum number of seconds to wait for a pipeline run to complete
+RUN_TIMEOUT = 3600
+# State returned for the runs that did not complete before the timeout
+TIMEOUT_STATE = 'TIMEOUT'
 
 
-def pipeline_run(pvc_name, pipeline_func, pipeline_filename):
+def pipeline_run(pvc_name, pipeline_func, pipeline_filename, monitors=None, namespace=DEFAULT_NAMESPACE,
+                 timeout=RUN_TIMEOUT):
     """
-    Initiates a Kubeflow pipeline run using a specified pipeline function and configuration.
+    Initiates a Kubeflow pipeline run using a specified pipeline function and configuration. If the run does not
+    complete before the timeout, it is terminated, so that it stops writing into its PVC.
 
     :param pvc_name: The name of the PVC to store component outputs into
     :param pipeline_func: Kubeflow Pipeline function to execute
     :param pipeline_filename: Name of Kubeflow Pipeline YAML configuration file
+    :param monitors: Optional list of objects, with start(run_id) and stop() methods, watching the run while it executes
+    :param namespace: Kubernetes namespace where the pipeline is run, the same as the PVC
+    :param timeout: Maximum number of seconds to wait for the run to complete
+    :return: A tuple containing the ID of the submitted pipeline run and its final state (e.g. 'SUCCEEDED', 'FAILED',
+             or 'TIMEOUT' if it did not complete in time)
     """
     # Create a Kubeflow Pipelines client using the KFPClientManager, which handles authentication and connection
     # details to the Kubeflow Pipelines API.
@@ -25,7 +36,7 @@ def pipeline_run(pvc_name, pipeline_func, pipeline_filename):
     client = kfp_client_manager.create_kfp_client()
 
     # Set Kubernetes namespace for the pipeline run
-    client.set_user_namespace(NAMESPACE)
+    client.set_user_namespace(namespace)
 
     # Compile the provided pipeline function into a YAML configuration file, saving it with the specified filename
     kfp.compiler.Compiler().compile(pipeline_func=pipeline_func, package_path=pipeline_filename)
@@ -39,11 +50,27 @@ def pipeline_run(pvc_name, pipeline_func, pipeline_filename):
         },
         run_name=run_name,
         experiment_name='auto_kubepipe',
-        namespace=NAMESPACE,
+        namespace=namespace,
         enable_caching=False
     )
 
     # Waits for the pipeline run to complete
     run_id = str(run.run_id)
-    client.wait_for_run_completion(run_id=run_id, timeout=3600, sleep_duration=10)
+    monitors = monitors or []
+    for monitor in monitors:
+        monitor.start(run_id)
+    try:
+        run = client.wait_for_run_completion(run_id=run_id, timeout=timeout, sleep_duration=10)
+        state = str(run.state)
+    except TimeoutError:
+        logging.error(f"Pipeline run {run_id} did not complete in {timeout} seconds, terminating it")
+        try:
+            client.terminate_run(run_id)
+        except Exception as e:
+            logging.error(f"Failed to terminate pipeline run {run_id}: {e}")
+        state = TIMEOUT_STATE
+    finally:
+        for monitor in monitors:
+            monitor.stop()
+    return run_id, state
 
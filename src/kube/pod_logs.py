@@ -0,0 +1,99 @@
+import threading
+import subprocess
+import logging
+
+from .namespaces import DEFAULT_NAMESPACE
+from .resource_profiler import MAIN_CONTAINER, get_run_pods, get_pod_component
+
+
+def container_started(pod: dict):
+    """
+    Check if the main container of a task pod has started, so that its logs can be followed
+
+    :param pod: Pod object as returned by the Kubernetes API
+    :return: True if the main container is running or terminated
+    """
+    for status in pod.get('status', {}).get('containerStatuses', []):
+        if status['name'] == MAIN_CONTAINER:
+            return 'running' in status.get('state', {}) or 'terminated' in status.get('state', {})
+    return False
+
+
+class PodLogTailer:
+    """
+    A class that follows the logs of the task pods of a pipeline run while it executes, logging each line with the
+    name of the component that produced it.
+    """
+    def __init__(self, namespace: str = DEFAULT_NAMESPACE, components: set = None, interval: int = 5):
+        """
+        Initialize the PodLogTailer
+
+        :param namespace: Kubernetes namespace where the run is executed
+        :param components: Names of the components of the pipeline, the other pods of the run are ignored
+        :param interval: Seconds to wait between two checks for new task pods
+        """
+        self._namespace = namespace
+        self._components = components
+        self._interval = interval
+        self._run_id = None
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._followers = {}
+        self._lock = threading.Lock()
+
+    def start(self, run_id: str):
+        """
+        Start following the logs of the task pods of the given run in a background thread
+
+        :param run_id: ID of the Kubeflow pipeline run
+        """
+        self._run_id = run_id
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._watch_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop following the logs, terminating the 'kubectl logs' processes that are still running
+        """
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        with self._lock:
+            for process, thread in self._followers.values():
+                if process.poll() is None:
+                    process.terminate()
+                thread.join(timeout=5)
+            self._followers.clear()
+
+    def _watch_loop(self):
+        while not self._stop_event.is_set():
+            for pod in get_run_pods(self._run_id, self._namespace):
+                pod_name = pod['metadata']['name']
+                component = get_pod_component(pod, self._components)
+                if component is None or pod_name in self._followers or not container_started(pod):
+                    continue
+                self._follow(pod_name, component)
+            self._stop_event.wait(self._interval)
+
+    def _follow(self, pod_name: str, component: str):
+        command = ["kubectl", "logs", "-f", pod_name, "-c", MAIN_CONTAINER, "-n", self._namespace]
+        try:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                                       bufsize=1, errors='replace')
+        except OSError as e:
+            logging.error(f"Failed to follow logs of {component}: {e}")
+            return
+        thread = threading.Thread(target=self._log_lines, args=(process, component), daemon=True)
+        with self._lock:
+            self._followers[pod_name] = (process, thread)
+        thread.start()
+
+    @staticmethod
+    def _log_lines(process: subprocess.Popen, component: str):
+        with process.stdout:
+            for line in process.stdout:
+                logging.info(f"[{component}] {line.rstrip()}")
+        process.wait()
@@ -1,15 +1,34 @@
+import os
 import uuid
-import time
+import fcntl
+import shutil
+import tempfile
 import subprocess
 import logging
 
-# Namespace defined and used with deployKF
-NAMESPACE = 'team-1'
+from .namespaces import DEFAULT_NAMESPACE, NAMESPACES_PATH, PVC_PREFIX, KEPT_LABEL, wait_for_namespaces
+
+# Storage capacity requested by the PVC of each pipeline run
+PVC_STORAGE_SIZE = '5Gi'
+# Lock file serializing the placement of the runs started from this machine, which would otherwise all see the same
+# namespace usage and exceed the caps of the top-ranked namespace
+PLACEMENT_LOCK_PATH = os.path.join(tempfile.gettempdir(), 'autopipe-placement.lock')
 # Configure logging to display information based on your needs
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s] - %(message)s', datefmt='%H:%M:%S')
 
 
-def create_pvc(storage_size: str = '5Gi'):
+def access_pod_name(pvc_name: str):
+    """
+    Get the name of the temporary pod used to access the content of a PVC, unique for each PVC so that concurrent runs
+    do not collide
+
+    :param pvc_name: The name of the PVC
+    :return: The name of the access pod
+    """
+    return f"access-{pvc_name}"
+
+
+def create_pvc(storage_size: str = PVC_STORAGE_SIZE, namespace: str = DEFAULT_NAMESPACE):
     """
     Creates a Kubernetes PersistentVolumeClaim (PVC) with a unique name, using a UUID to avoid name collisions.
     The PVC is created with a specified storage size and is intended for use within a specific Kubernetes namespace.
@@ -17,17 +36,18 @@ def create_pvc(storage_size: str = '5Gi'):
     application has its own dedicated storage resources.
 
     :param storage_size: Storage capacity for the PVC, defaults to '5Gi'
+    :param namespace: Kubernetes namespace where the PVC is created
     :return: The unique name of the created PVC
     """
     unique_id = str(uuid.uuid4())
-    pvc_name = f"mypipe-pvc-{unique_id}"
+    pvc_name = f"{PVC_PREFIX}{unique_id}"
     # Default YAML template for creating a PVC
     pvc_yaml = f"""
 apiVersion: v1
 kind: PersistentVolumeClaim
 metadata:
   name: {pvc_name}
-  namespace: {NAMESPACE}
+  namespace: {namespace}
 spec:
   accessModes:
     - ReadWriteOnce
@@ -38,29 +58,54 @@ spec:
 """
     try:
         subprocess.run(["kubectl", "apply", "-f", "-"], input=pvc_yaml, text=True, capture_output=True, check=True)
-        logging.info(f"PVC {pvc_name} created successfully")
+        logging.info(f"PVC {pvc_name} created successfully in namespace {namespace}")
     except subprocess.CalledProcessError as e:
         logging.error(f"Failed to create PVC: {e.stderr}")
         return None
     return pvc_name
 
 
-def download_from_pvc(pvc_name: str, local_path: str):
+def place_pvc(storage_size: str = PVC_STORAGE_SIZE, config_path: str = NAMESPACES_PATH,
+              lock_path: str = PLACEMENT_LOCK_PATH):
     """
-    Downloads files from a specified PersistentVolumeClaim (PVC) to a local directory.
-    Achieved by creating a temporary Kubernetes Pod that mounts the PVC and then copying the files from the PVC to the
-    local provided path.
+    Create the PVC of a new run in the configured namespace with the most headroom. If the creation is rejected, e.g.
+    because a run started from another machine exhausted the quota in the meantime, the next namespaces are tried in
+    order of headroom. The caps of namespaces.yaml are not enforced by Kubernetes, so the runs started from this
+    machine are placed one at a time, each of them seeing the PVCs created by the previous ones.
 
-    :param pvc_name: The name of the PVC to download content from
-    :param local_path: The local path where you want to store the downloaded file
+    :param storage_size: Storage capacity for the PVC, defaults to '5Gi'
+    :param config_path: Path to the namespaces YAML configuration file
+    :param lock_path: Path to the lock file shared by the runs started from this machine
+    :return: A tuple containing the name of the created PVC and its namespace, (None, None) if no namespace had room
     """
+    with open(lock_path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            for namespace in wait_for_namespaces(storage_size, config_path=config_path):
+                pvc_name = create_pvc(storage_size, namespace)
+                if pvc_name is not None:
+                    return pvc_name, namespace
+            return None, None
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def create_access_pod(pvc_name: str, namespace: str = DEFAULT_NAMESPACE):
+    """
+    Creates a temporary Kubernetes Pod that mounts the specified PVC under '/mnt/data', and waits for it to be ready
+
+    :param pvc_name: The name of the PVC to mount
+    :param namespace: Kubernetes namespace of the PVC
+    :return: True if the pod is ready to be used
+    """
+    access_pod = access_pod_name(pvc_name)
     # YAML definition to create a Pod with the desired PVC attached to it
-    pvc_yaml = f"""
+    pod_yaml = f"""
 apiVersion: v1
 kind: Pod
 metadata:  
-  name: pvc-access-pod
-  namespace: {NAMESPACE}
+  name: {access_pod}
+  namespace: {namespace}
 spec:
   containers:  
   - name: pvc-access-container
@@ -75,30 +120,123 @@ spec:
       claimName: {pvc_name}
 """
     try:
-        subprocess.run(["kubectl", "apply", "-f", "-"], input=pvc_yaml, text=True, capture_output=True, check=True)
-        time.sleep(10)
-        logging.info("Pod created successfully. Proceeding with file copy...")
+        subprocess.run(["kubectl", "apply", "-f", "-"], input=pod_yaml, text=True, capture_output=True, check=True)
+        subprocess.run(["kubectl", "wait", "--for=condition=Ready", f"pod/{access_pod}", "-n", namespace, "--timeout=120s"], capture_output=True, text=True, check=True)
+        logging.info("Pod created successfully")
+    except subprocess.CalledProcessError as e:
+        logging.error(f"Failed to create access pod: {e.stderr}")
+        return False
+    return True
 
-        subprocess.run(["kubectl", "cp", f"{NAMESPACE}/pvc-access-pod:/mnt/data", local_path], capture_output=True, text=True, check=True)
-        time.sleep(5)
-        logging.info("Files copied successfully")
 
-        subprocess.run(["kubectl", "delete", "pod", "pvc-access-pod", "-n", NAMESPACE], capture_output=True, text=True, check=True)
-        time.sleep(10)
+def delete_access_pod(pvc_name: str, namespace: str = DEFAULT_NAMESPACE):
+    """
+    Deletes the temporary Pod used to access the content of a PVC
+
+    :param pvc_name: The name of the PVC mounted by the pod
+    :param namespace: Kubernetes namespace of the PVC
+    """
+    try:
+        subprocess.run(["kubectl", "delete", "pod", access_pod_name(pvc_name), "-n", namespace], capture_output=True, text=True, check=True)
         logging.info("Temporary pod deleted successfully")
+    except subprocess.CalledProcessError as e:
+        logging.error(f"Failed to delete access pod: {e.stderr}")
+
+
+def directory_size(path: str):
+    """
+    Compute the total size of the files contained in a directory
+
+    :param path: Path to the directory
+    :return: Total size in bytes
+    """
+    return sum(os.path.getsize(os.path.join(root, file)) for root, _, files in os.walk(path) for file in files)
+
+
+def download_from_pvc(pvc_name: str, local_path: str, namespace: str = DEFAULT_NAMESPACE):
+    """
+    Downloads files from a specified PersistentVolumeClaim (PVC) to a local directory.
+    Achieved by creating a temporary Kubernetes Pod that mounts the PVC and then copying the files from the PVC to the
+    local provided path. The files are copied into a temporary directory first, to measure what was downloaded even
+    when it overwrites the outputs of a previous run.
 
+    :param pvc_name: The name of the PVC to download content from
+    :param local_path: The local path where you want to store the downloaded file
+    :param namespace: Kubernetes namespace of the PVC
+    :return: Number of bytes downloaded, None if the files could not be copied
+    """
+    if not create_access_pod(pvc_name, namespace):
+        return None
+    try:
+        logging.info("Proceeding with file copy...")
+        with tempfile.TemporaryDirectory() as download_dir:
+            download_path = os.path.join(download_dir, 'data')
+            subprocess.run(["kubectl", "cp", f"{namespace}/{access_pod_name(pvc_name)}:/mnt/data", download_path], capture_output=True, text=True, check=True)
+            size = directory_size(download_path)
+            shutil.copytree(download_path, local_path, dirs_exist_ok=True)
+        logging.info("Files copied successfully")
+        return size
     except subprocess.CalledProcessError as e:
         logging.error(f"Command failed: {e.stderr}")
+        return None
+    finally:
+        delete_access_pod(pvc_name, namespace)
+
+
+def check_outputs_in_pvc(pvc_name: str, file_names: list, namespace: str = DEFAULT_NAMESPACE):
+    """
+    Checks which of the given files exist in a PVC and are valid, i.e. non-empty and, for '.tar.gz' outputs, readable
+    archives. Used to find which components of a failed pipeline run completed successfully.
+
+    :param pvc_name: The name of the PVC to inspect
+    :param file_names: Names of the files to look for, relative to the root of the PVC
+    :param namespace: Kubernetes namespace of the PVC
+    :return: Set of the valid file names, None if the PVC could not be inspected
+    """
+    if not create_access_pod(pvc_name, namespace):
+        return None
+    checks = []
+    for file_name in file_names:
+        path = f"/mnt/data/{file_name}"
+        if file_name.endswith('.tar.gz'):
+            checks.append(f"test -s '{path}' && tar -tzf '{path}' > /dev/null 2>&1 && echo '{file_name}'")
+        else:
+            checks.append(f"test -s '{path}' && echo '{file_name}'")
+    try:
+        result = subprocess.run(["kubectl", "exec", access_pod_name(pvc_name), "-n", namespace, "--", "sh", "-c", "; ".join(checks) + "; true"], capture_output=True, text=True, check=True)
+        return set(result.stdout.split())
+    except subprocess.CalledProcessError as e:
+        logging.error(f"Failed to inspect PVC {pvc_name}: {e.stderr}")
+        return None
+    finally:
+        delete_access_pod(pvc_name, namespace)
+
+
+def mark_pvc_kept(pvc_name: str, namespace: str = DEFAULT_NAMESPACE, kept: bool = True):
+    """
+    Label the PVC of a failed run as kept to resume it, so that it is not counted as an active run when placing new
+    runs, or remove the label when the run is resumed
+
+    :param pvc_name: The name of the PVC
+    :param namespace: Kubernetes namespace of the PVC
+    :param kept: True to label the PVC as kept, False to remove the label
+    """
+    label = f"{KEPT_LABEL}=true" if kept else f"{KEPT_LABEL}-"
+    try:
+        subprocess.run(["kubectl", "label", "pvc", pvc_name, label, "-n", namespace, "--overwrite"], capture_output=True, text=True, check=True)
+    except subprocess.CalledProcessError as e:
+        logging.error(f"Failed to label PVC {pvc_name}: {e.stderr}")
 
 
-def delete_pvc(pvc_name: str):
+def delete_pvc(pvc_name: str, namespace: str = DEFAULT_NAMESPACE):
     """
     Deletes a specified Kubernetes PersistentVolumeClaim (PVC)
 
     :param pvc_name: The name of the PVC to delete
+    :param namespace: Kubernetes namespace of the PVC
     """
     try:
-        subprocess.run(["kubectl", "delete", "pvc", pvc_name, "-n", NAMESPACE, "--grace-period=0", "--force"], capture_output=True, text=True, check=True)
+        subprocess.run(["kubectl", "delete", "pvc", pvc_name, "-n", namespace, "--grace-period=0", "--force"], capture_output=True, text=True, check=True)
         logging.info(f"PVC {pvc_name} deleted successfully")
     except subprocess.CalledProcessError as e:
         logging.error(f"Failed to delete PVC: {e.stderr}")
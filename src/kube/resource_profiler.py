@@ -0,0 +1,206 @@
+import json
+import threading
+import subprocess
+import logging
+from datetime import datetime
+
+from .namespaces import DEFAULT_NAMESPACE
+
+# Name of the container running the component code inside each KFP task pod
+MAIN_CONTAINER = 'main'
+# Configure logging to display information based on your needs
+logging.basicConfig(level=logging.INFO, format='[%(asctime)s] - %(message)s', datefmt='%H:%M:%S')
+
+
+def parse_cpu(quantity: str):
+    """
+    Convert a Kubernetes CPU quantity into millicores
+
+    :param quantity: CPU quantity as reported by Kubernetes (e.g. '250m', '2', '1500000n')
+    :return: The CPU quantity in millicores
+    """
+    if quantity.endswith('n'):
+        return float(quantity[:-1]) / 1_000_000
+    if quantity.endswith('u'):
+        return float(quantity[:-1]) / 1_000
+    if quantity.endswith('m'):
+        return float(quantity[:-1])
+    return float(quantity) * 1000
+
+
+def parse_memory(quantity: str):
+    """
+    Convert a Kubernetes memory quantity into MiB
+
+    :param quantity: Memory quantity as reported by Kubernetes (e.g. '128Mi', '1Gi', '500M')
+    :return: The memory quantity in MiB
+    """
+    units = {
+        'Ki': 1 / 1024, 'Mi': 1, 'Gi': 1024, 'Ti': 1024 ** 2,
+        'K': 1000 / 1024 ** 2, 'M': 1000 ** 2 / 1024 ** 2, 'G': 1000 ** 3 / 1024 ** 2, 'T': 1000 ** 4 / 1024 ** 2
+    }
+    for suffix in sorted(units, key=len, reverse=True):
+        if quantity.endswith(suffix):
+            return float(quantity[:-len(suffix)]) * units[suffix]
+    return float(quantity) / 1024 ** 2
+
+
+def component_from_image(image: str):
+    """
+    Extract the component name from the image of a task pod, following the '<username>/<component>:<tag>' convention
+    used when building the images
+
+    :param image: Image reference of the container
+    :return: Name of the component
+    """
+    return image.split('/')[-1].split('@')[0].split(':')[0]
+
+
+def get_run_pods(run_id: str, namespace: str = DEFAULT_NAMESPACE):
+    """
+    Retrieve the pods created for a specific Kubeflow pipeline run
+
+    :param run_id: ID of the Kubeflow pipeline run
+    :param namespace: Kubernetes namespace where the run is executed
+    :return: List of pod objects as returned by the Kubernetes API, empty if they cannot be retrieved
+    """
+    command = ["kubectl", "get", "pods", "-n", namespace, "-l", f"pipeline/runid={run_id}", "-o", "json"]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        logging.error(f"Failed to list pods of run {run_id}: {result.stderr}")
+        return []
+    return json.loads(result.stdout).get('items', [])
+
+
+def get_pod_component(pod: dict, components: set = None):
+    """
+    Find the component executed by a task pod, by looking at the image of its main container. The KFP driver pods of
+    the run also have a main container, so only the images of the pipeline components are considered.
+
+    :param pod: Pod object as returned by the Kubernetes API
+    :param components: Names of the components of the pipeline, any image is considered a component if not defined
+    :return: Name of the component, None if the pod does not run a component
+    """
+    for container in pod['spec'].get('containers', []):
+        if container['name'] == MAIN_CONTAINER:
+            component = component_from_image(container['image'])
+            return component if components is None or component in components else None
+    return None
+
+
+def get_pod_duration(pod: dict):
+    """
+    Compute how long the main container of a task pod has been running
+
+    :param pod: Pod object as returned by the Kubernetes API
+    :return: Duration in seconds, None if the container has not started yet
+    """
+    for status in pod.get('status', {}).get('containerStatuses', []):
+        if status['name'] != MAIN_CONTAINER:
+            continue
+        state = status.get('state', {})
+        if 'terminated' in state:
+            started, finished = state['terminated'].get('startedAt'), state['terminated'].get('finishedAt')
+        elif 'running' in state:
+            started, finished = state['running'].get('startedAt'), None
+        else:
+            return None
+        if not started:
+            return None
+        start = datetime.strptime(started, '%Y-%m-%dT%H:%M:%SZ')
+        end = datetime.strptime(finished, '%Y-%m-%dT%H:%M:%SZ') if finished else datetime.utcnow()
+        return (end - start).total_seconds()
+    return None
+
+
+def sample_pod_usage(run_id: str, namespace: str = DEFAULT_NAMESPACE):
+    """
+    Sample the current CPU and memory usage of the main container of each pod of a run, through the metrics API
+    exposed by 'kubectl top'
+
+    :param run_id: ID of the Kubeflow pipeline run
+    :param namespace: Kubernetes namespace where the run is executed
+    :return: Dictionary mapping each pod name to a (cpu millicores, memory MiB) tuple
+    """
+    command = ["kubectl", "top", "pod", "-n", namespace, "-l", f"pipeline/runid={run_id}", "--containers", "--no-headers"]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        logging.debug(f"Failed to sample pod usage of run {run_id}: {result.stderr}")
+        return {}
+
+    usage = {}
+    for line in result.stdout.splitlines():
+        fields = line.split()
+        if len(fields) < 4 or fields[1] != MAIN_CONTAINER:
+            continue
+        usage[fields[0]] = (parse_cpu(fields[2]), parse_memory(fields[3]))
+    return usage
+
+
+class ResourceProfiler:
+    """
+    A class that periodically samples the resource usage of the task pods of a pipeline run, keeping track of the peak
+    usage and duration of each component.
+    """
+    def __init__(self, namespace: str = DEFAULT_NAMESPACE, components: set = None, interval: int = 15):
+        """
+        Initialize the ResourceProfiler
+
+        :param namespace: Kubernetes namespace where the run is executed
+        :param components: Names of the components of the pipeline, the other pods of the run are ignored
+        :param interval: Seconds to wait between two samples
+        """
+        self._namespace = namespace
+        self._components = components
+        self._interval = interval
+        self._run_id = None
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._pod_components = {}
+        self.profiles = {}
+
+    def start(self, run_id: str):
+        """
+        Start sampling the pods of the given run in a background thread
+
+        :param run_id: ID of the Kubeflow pipeline run
+        """
+        self._run_id = run_id
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._sample_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop sampling and collect the final duration of each component
+        """
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        self._update_pods()
+
+    def _update_pods(self):
+        for pod in get_run_pods(self._run_id, self._namespace):
+            component = get_pod_component(pod, self._components)
+            if component is None:
+                continue
+            self._pod_components[pod['metadata']['name']] = component
+            profile = self.profiles.setdefault(component, {'cpu': 0.0, 'memory': 0.0, 'duration': None})
+            duration = get_pod_duration(pod)
+            if duration is not None:
+                profile['duration'] = max(profile['duration'] or 0.0, duration)
+
+    def _sample_loop(self):
+        while not self._stop_event.is_set():
+            self._update_pods()
+            for pod_name, (cpu, memory) in sample_pod_usage(self._run_id, self._namespace).items():
+                component = self._pod_components.get(pod_name)
+                if component is None:
+                    continue
+                profile = self.profiles[component]
+                profile['cpu'] = max(profile['cpu'], cpu)
+                profile['memory'] = max(profile['memory'], memory)
+            self._stop_event.wait(self._interval)
+
@@ -0,0 +1,32 @@
+import logging
+import subprocess
+from collections import deque
+
+# Number of last output lines kept in memory for each command, to be reported if it fails
+TAIL_LINES = 200
+
+
+def stream_command(command: list, prefix: str, cwd: str = None, tail_lines: int = TAIL_LINES):
+    """
+    Run a command, logging its stdout and stderr line by line while it executes. Only the last lines of the output are
+    kept in memory, in a ring buffer, so that long-running commands with verbose output do not fill the memory.
+
+    :param command: Command to run, as a list of arguments
+    :param prefix: Prefix added to each logged line, to identify the command
+    :param cwd: Working directory of the command
+    :param tail_lines: Number of last output lines to keep
+    :return: A tuple containing the return code of the command and the list of its last output lines
+    """
+    tail = deque(maxlen=tail_lines)
+    try:
+        process = subprocess.Popen(command, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                                   bufsize=1, errors='replace')
+    except OSError as e:
+        return 127, [str(e)]
+
+    with process.stdout:
+        for line in process.stdout:
+            line = line.rstrip()
+            tail.append(line)
+            logging.info(f"[{prefix}] {line}")
+    return process.wait(), list(tail)
@@ -1,32 +1,30 @@
 import os
 import time
-import yaml
 import subprocess
 import logging
 import argparse
-from dotenv import load_dotenv
 
 from kfp import dsl
 from kfp.kubernetes import mount_pvc
 
 from kube.pvc_manager import *
 from kube.pipeline_run import *
+from kube.resource_profiler import ResourceProfiler
+from kube.pod_logs import PodLogTailer
+from kube.namespaces import find_pvc_namespace
+from dag_config import DagConfig, SAVE_MEDIA, load_dag_config
+from registry import load_registry_config, image_reference
+from run_history import (current_run_id, start_run, update_run, finish_run, record_task, get_task_profiles,
+                         add_bytes, last_failed_pvc, percentile)
 
 
 # Configure logging to display information based on your needs
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s] - %(message)s', datefmt='%H:%M:%S')
-
-
-def load_dag_configuration(dag_path):
-    """
-    Load the yaml dag configuration file, to extract the required information
-
-    :param dag_path: The file path to the YAML configuration file
-    :return: A tuple containing lists of components, dependencies, and the initial input media file path
-    """
-    with open(dag_path, 'r') as file:
-        data = yaml.safe_load(file)
-        return data['System']['components'], data['System']['dependencies'], data['System']['input_media']
+# Lower bounds applied to the generated requests, to avoid scheduling pods with unusable resources
+MIN_CPU_MILLICORES = 100
+MIN_MEMORY_MIB = 128
+# Minimum number of successful runs profiled before right-sizing a component
+MIN_PROFILED_RUNS = 3
 
 
 # With download_from_pvc method defined in pvc_manager.py, it might be possible to search for the output file path
@@ -48,21 +46,21 @@ def get_output_filepath(output_dir: str):
 """
 
 
-def create_component(username: str, component_name: str):
+def create_component(image: str, component_name: str):
     """
     Dynamically create a reusable container component for the Kubeflow Pipeline steps
 
-    :param username: Docker username to prefix to the Docker image name
-    :param component_name: Name of the component, used to generate the function name and specify the Docker image
+    :param image: Reference of the Docker image of the component, as pulled by the cluster nodes
+    :param component_name: Name of the component, used to generate the function name
     """
-    comp_name = component_name.replace('-', '_')
+    comp_name = DagConfig.identifier(component_name)
 
     # Default kfp.container_component configuration
     component_code = f"""
 @dsl.container_component
 def {comp_name}(input_path: str, output_path: str):
     return dsl.ContainerSpec(
-        image=f'{username}/{component_name}:latest',
+        image='{image}',
         command=['python', 'main.py'],
         args=[
             '-i', input_path, '-o', output_path
@@ -73,40 +71,125 @@ def {comp_name}(input_path: str, output_path: str):
     exec(component_code, globals())
 
 
-def setup_component(component_name: str, input_path: str, output_dir: str, pvc_name: str):
+def setup_component(component_name: str, input_path: str, output_dir: str, pvc_name: str, resources: dict = None,
+                    retry: dict = None):
     """
-    Set up a component for the pipeline with various configurations (including input and output paths, and PVC mounting),
-    by retrieving the dynamically created component function.
+    Set up a component for the pipeline with various configurations (including input and output paths, PVC mounting,
+    resource requests and retries), by retrieving the dynamically created component function.
     If needed, the method can be extended to include more configurations based on the Kubeflow pipeline requirements.
 
     :param name: Name of the component to be included in the pipeline
     :param input_path: Path to the input file for the component
     :param output_dir: Output directory for the component's results
     :param pvc_name: Name of the Persistent Volume Claim (PVC) to be mounted
+    :param resources: Optional cpu/memory requests, as returned by compute_resources
+    :param retry: Optional retry policy, with num_retries, backoff_duration, backoff_factor and backoff_max_duration
     :return: Configured component operation for the pipeline
     """
-    comp_func = globals().get(component_name.replace('-', '_'))
+    comp_func = globals().get(DagConfig.identifier(component_name))
     component_op = comp_func(input_path=input_path, output_path=output_dir)
     component_op = mount_pvc(component_op, pvc_name=pvc_name, mount_path='/mnt/data')
+    # Right-size the component pod based on the resource usage profiled in previous runs
+    if resources:
+        component_op.set_cpu_request(resources['cpu_request'])
+        component_op.set_memory_request(resources['memory_request'])
+    # Retry the component with backoff if it fails, e.g. because of a transient error
+    if retry:
+        component_op.set_retry(**retry)
     # Caching can be enabled or disabled here for a specific component, if needed.
     # component_op.set_caching_options(False)
     return component_op
 
 
-def generate_pipeline(username: str, dag_components: list, dag_dependencies: list, init_input: str):
+def compute_resources(component: str, request_pct: float = 50, headroom: float = 1.2, max_runs: int = 20,
+                      min_runs: int = MIN_PROFILED_RUNS):
+    """
+    Compute the resource requests of a component from the peak usage recorded in the run history by previous
+    successful runs. Only requests are set, from the `request_pct` percentile increased by the given headroom factor:
+    the peaks come from periodic samples of averaged usage and underestimate the real ones, so hard limits derived
+    from them would get the pods OOM-killed on larger inputs.
+
+    :param component: Name of the component
+    :param request_pct: Percentile of the peak usage used for the requests
+    :param headroom: Multiplicative factor applied on top of the percentile
+    :param max_runs: Number of most recent runs to take into account
+    :param min_runs: Minimum number of profiled runs needed to compute the requests
+    :return: Dictionary with cpu_request and memory_request, None if not enough runs were profiled
+    """
+    profiles = get_task_profiles(component, max_runs)
+    if len(profiles) < min_runs:
+        return None
+
+    cpu_request = max(MIN_CPU_MILLICORES, int(percentile([cpu for cpu, _ in profiles], request_pct) * headroom))
+    memory_request = max(MIN_MEMORY_MIB, int(percentile([memory for _, memory in profiles], request_pct) * headroom))
+    return {
+        'cpu_request': f"{cpu_request}m",
+        'memory_request': f"{memory_request}Mi"
+    }
+
+
+def find_completed_components(pvc_name: str, namespace: str, config: DagConfig):
+    """
+    Find the components of a previous run whose output is already saved and valid in its PVC, following the
+    '<component>.tar.gz' output convention. 'save-media' is considered completed if the input media is in the PVC.
+
+    :param pvc_name: Name of the PVC kept by the previous run
+    :param namespace: Kubernetes namespace of the PVC
+    :param config: Validated DAG configuration
+    :return: Set of completed components, None if the PVC could not be inspected
+    """
+    outputs = {f"{component}.tar.gz": component for component in config.components}
+    outputs[config.input_filename] = SAVE_MEDIA
+    valid_outputs = check_outputs_in_pvc(pvc_name, list(outputs), namespace)
+    if valid_outputs is None:
+        return None
+    return {outputs[output] for output in valid_outputs if output in outputs}
+
+
+def find_pending_components(config: DagConfig, completed: set):
+    """
+    Find the components that have to be executed: the ones that are not completed, and all the components downstream
+    of them, since their input will change
+
+    :param config: Validated DAG configuration
+    :param completed: Set of components whose output is already available
+    :return: Set of components to execute
+    """
+    pending = {component for component in config.components + [SAVE_MEDIA] if component not in completed}
+    to_visit = list(pending)
+    while to_visit:
+        for next_component in config.downstream.get(to_visit.pop(), []):
+            if next_component not in pending:
+                pending.add(next_component)
+                to_visit.append(next_component)
+    return pending
+
+
+def generate_pipeline(registry_config: dict, config: DagConfig, pending: set = None):
     """
     Dynamically generate a Kubeflow Pipeline based on the DAG configuration. This involves creating container
     components for each step in the pipeline and setting up their execution order based on dependencies.
+    When resuming a failed run, only the pending components are added to the pipeline, starting from the ones that
+    failed, since the outputs of the others are already available in the PVC.
 
-    :param username: Docker username for Docker image naming
-    :param dag_components: List of components defined in the DAG configuration file
-    :param dag_dependencies: List of dependencies defined in the DAG configuration file
-    :param init_input: Name of the initial input media file path
+    :param registry_config: Image delivery configuration, used to get the image reference of each component
+    :param config: Validated DAG configuration, with the components, their dependencies and retry policies
+    :param pending: Set of components to execute, all of them if not defined
     :return: The Kubeflow Pipeline function
     """
-    for component in dag_components:
-        create_component(username, component)
-    create_component(username, 'save-media')
+    all_components = config.components + [SAVE_MEDIA]
+    if pending is None:
+        pending = set(all_components)
+    init_input = config.input_filename
+
+    for component in all_components:
+        create_component(image_reference(registry_config, component), component)
+
+    # Compute the requests of each component from the resource profiles of the previous successful runs
+    resources = {component: compute_resources(component) for component in all_components}
+    for component, component_resources in resources.items():
+        if component_resources:
+            logging.info(f"Resources for {component} based on previous runs: {component_resources}")
 
     @dsl.pipeline(
         name="Kubeflow Autopipe",
@@ -115,63 +198,132 @@ def generate_pipeline(username: str, dag_components: list, dag_dependencies: lis
     def dynamic_pipeline(pvc_name: str):
         base_mount = "/mnt/data"
         component_op = {}
-        input_path = init_input
-
-        # Set up the save_media component as first component
-        output_dir = f"{base_mount}/"
-        component_op['save-media'] = setup_component('save-media', input_path, output_dir, pvc_name)
-
-        # Set up the other components based on dependencies
-        for dependency in dag_dependencies:
-            this_component, next_component, _ = dependency
 
-            if this_component not in component_op:
-                output_dir_this = f"{base_mount}/{this_component}"
-                input_path = f"{base_mount}/{init_input}"
-                component_op[this_component] = setup_component(this_component, input_path, output_dir_this, pvc_name)
-                component_op[this_component].after(component_op['save-media'])
+        def add_component(name: str, input_path: str, output_dir: str):
+            # Components already completed in a previous run are not executed again
+            if name not in pending:
+                component_op[name] = None
+                return
+            component_op[name] = setup_component(name, input_path, output_dir, pvc_name, resources.get(name),
+                                                  config.retries.get(name))
 
-            if next_component not in component_op:
-                output_dir_next = f"{base_mount}/{next_component}"
-                input_path = f"{base_mount}/{this_component}.tar.gz"
-                component_op[next_component] = setup_component(next_component, input_path, output_dir_next, pvc_name)
-                component_op[next_component].after(component_op[this_component])
+        # Set up the save_media component as first component
+        add_component(SAVE_MEDIA, init_input, f"{base_mount}/")
+
+        # Set up the other components that are part of a dependency, reading the output of their first upstream
+        # component, or the input media if they have none
+        for component in config.components:
+            upstream = config.upstream[component]
+            if not upstream and not config.downstream[component]:
+                continue
+            input_path = f"{base_mount}/{upstream[0]}.tar.gz" if upstream else f"{base_mount}/{init_input}"
+            add_component(component, input_path, f"{base_mount}/{component}")
+
+        # Each component runs after all of its upstream components, the first ones after save_media
+        for component, op in component_op.items():
+            if op is None or component == SAVE_MEDIA:
+                continue
+            for upstream in config.upstream[component] or [SAVE_MEDIA]:
+                if component_op[upstream] is not None:
+                    op.after(component_op[upstream])
 
     return dynamic_pipeline
 
 
-def main(input_file: str):
+def main(input_file: str, resume: str = None, follow_logs: bool = False):
+    """
+    Create, execute and collect the outputs of the Kubeflow pipeline. If the pipeline fails, its PVC is kept so
+    that the run can be resumed from the components that did not complete.
+
+    :param input_file: Path to the application_dag.yaml configuration file
+    :param resume: Name of the PVC of a failed run to resume, 'latest' for the last failed run in the run history
+    :param follow_logs: If True, follow the logs of the component pods while the pipeline runs
+    """
     # Define the local path to store the outputs saved into the pvc
     local_path = 'output'
     # Save need data from the configuration file
-    dag_components, dag_dependencies, media = load_dag_configuration(input_file)
-
-    # Save register_username defined in the .env file
-    load_dotenv()
-    register_username = os.getenv('register_USERNAME')
-
-    # Create the PVC for the pipeline
-    pvc_name = create_pvc()
-
-    # Save the name of the file to be used as input for the pipeline
-    input_filename = os.path.basename(media)
-
-    # Generate the pipeline function
-    pipeline_func = generate_pipeline(username=register_username, dag_components=dag_components, dag_dependencies=dag_dependencies, init_input=input_filename)
-    pipeline_filename = 'pipeline.yaml'
-    # Execute the pipeline
-    pipeline_run(pvc_name, pipeline_func, pipeline_filename)
-    time.sleep(5)
+    config = load_dag_config(input_file)
+
+    # Load the image delivery configuration defined in the .env file, to reference the images of the components
+    registry_config = load_registry_config()
+
+    if resume:
+        # Reuse the PVC of the failed run, looking for the outputs of the components that already completed
+        pvc_name = last_failed_pvc() if resume == 'latest' else resume
+        if pvc_name is None:
+            logging.error("No failed run with a kept PVC found in the run history")
+            exit(1)
+        namespace = find_pvc_namespace(pvc_name)
+        if namespace is None:
+            logging.error(f"PVC {pvc_name} not found in the configured namespaces")
+            exit(1)
+        completed = find_completed_components(pvc_name, namespace, config)
+        if completed is None:
+            exit(1)
+        # The run is active again, and counted as such until it completes or fails again
+        mark_pvc_kept(pvc_name, namespace, kept=False)
+        logging.info(f"Resuming from PVC {pvc_name}, completed components: {sorted(completed) or 'none'}")
+    else:
+        # Create the PVC for the pipeline, in the namespace with the most headroom
+        pvc_name, namespace = place_pvc()
+        if pvc_name is None:
+            logging.error("Failed to place the PVC of the run in any of the configured namespaces")
+            exit(1)
+        completed = set()
+    # Record the run in the run history if the pipeline manager is executed on its own, outside of autopipe.py
+    run_id = current_run_id()
+    standalone = run_id is None
+    if standalone:
+        run_id = start_run(input_file, config.input_media)
+    update_run(run_id, pvc_name=pvc_name)
+
+    pending = find_pending_components(config, completed)
+    if pending:
+        # Generate the pipeline function
+        pipeline_func = generate_pipeline(registry_config=registry_config, config=config, pending=pending)
+        pipeline_filename = 'pipeline.yaml'
+        # Execute the pipeline, profiling the resources used by each component pod and optionally following their logs
+        components = set(config.components) | {SAVE_MEDIA}
+        profiler = ResourceProfiler(namespace, components)
+        monitors = [profiler, PodLogTailer(namespace, components)] if follow_logs else [profiler]
+        kfp_run_id, state = pipeline_run(pvc_name, pipeline_func, pipeline_filename, monitors=monitors, namespace=namespace)
+        update_run(run_id, kfp_run_id=kfp_run_id)
+        # Profiles of failed runs are truncated or OOM-killed, and would skew the requests of the next runs
+        profiled = state == 'SUCCEEDED'
+        if profiled and not any(profile['cpu'] > 0 for profile in profiler.profiles.values()):
+            logging.warning(f"No resource profiles collected for run {kfp_run_id}, is metrics-server installed?")
+        for component, profile in profiler.profiles.items():
+            if profile['duration'] is not None:
+                record_task(run_id, component, profile['duration'],
+                            profile['cpu'] if profiled else None, profile['memory'] if profiled else None)
+        time.sleep(5)
+    else:
+        logging.info("All the components are already completed, nothing to execute")
+        state = 'SUCCEEDED'
 
     # Download the output file from the PVC to the local machine
-    download_from_pvc(pvc_name, local_path)
+    downloaded = download_from_pvc(pvc_name, local_path, namespace)
+    add_bytes(run_id, output_bytes=downloaded or 0)
+
+    if state != 'SUCCEEDED':
+        # Keep the PVC, so that the completed outputs can be reused when resuming the run
+        mark_pvc_kept(pvc_name, namespace)
+        logging.error(f"Pipeline run ended with state {state}, PVC {pvc_name} kept. "
+                      f"Resume it with: python3 autopipe.py -i {input_file} --resume {pvc_name}")
+        if standalone:
+            finish_run(run_id, 1)
+        exit(1)
     # Delete the PVC after the pipeline execution
-    delete_pvc(pvc_name)
+    delete_pvc(pvc_name, namespace)
+    if standalone:
+        finish_run(run_id, 0)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("-i", "--input", required=True, help="path to application_dag.yaml configuration file")
+    parser.add_argument("--resume", nargs='?', const='latest', help="name of the PVC of a failed run to resume, the last failed run if not specified")
+    parser.add_argument("--follow-logs", action='store_true', help="follow the logs of the component pods while the pipeline runs")
     args = vars(parser.parse_args())
 
-    main(args['input'])
+    main(args['input'], args['resume'], args['follow_logs'])
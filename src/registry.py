@@ -0,0 +1,68 @@
+import os
+from dotenv import load_dotenv
+
+# Supported image delivery backends:
+# - dockerhub: push the images to Docker Hub, from where the cluster nodes pull them
+# - local: push the images to a registry running inside the cluster or on localhost
+# - sideload: import the images directly into the container runtime of the cluster nodes, without any registry
+BACKENDS = ['dockerhub', 'local', 'sideload']
+# Tools supported to side-load images into the nodes of a local cluster
+SIDELOAD_TOOLS = ['k3d', 'kind', 'minikube']
+# Tag of side-loaded images, not 'latest' so that Kubernetes does not try to pull them from a registry
+SIDELOAD_TAG = 'local'
+
+
+def load_registry_config():
+    """
+    Load the image delivery configuration from the .env file
+
+    :return: Dictionary containing the backend, registry endpoints, credentials and side-loading settings
+    """
+    load_dotenv()
+    backend = os.getenv('REGISTRY_BACKEND', 'dockerhub').strip().lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Invalid REGISTRY_BACKEND '{backend}', must be one of: {BACKENDS}")
+
+    endpoint = os.getenv('REGISTRY_ENDPOINT', 'localhost:5000').strip()
+    sideload_tool = os.getenv('SIDELOAD_TOOL', 'k3d').strip().lower()
+    if backend == 'sideload' and sideload_tool not in SIDELOAD_TOOLS:
+        raise ValueError(f"Invalid SIDELOAD_TOOL '{sideload_tool}', must be one of: {SIDELOAD_TOOLS}")
+
+    return {
+        'backend': backend,
+        'endpoint': endpoint,
+        # Endpoint used by the cluster nodes to pull the images, if different from the one used to push them
+        'pull_endpoint': os.getenv('REGISTRY_PULL_ENDPOINT', '').strip() or endpoint,
+        'username': (os.getenv('REGISTER_USERNAME') or '').strip(),
+        'password': (os.getenv('REGISTER_PASSWORD') or '').strip(),
+        'sideload_tool': sideload_tool,
+        'cluster_name': os.getenv('CLUSTER_NAME', '').strip()
+    }
+
+
+def image_tag(config: dict, component: str):
+    """
+    Get the tag used to build and deliver the image of a component
+
+    :param config: Image delivery configuration, as returned by load_registry_config
+    :param component: Name of the component
+    :return: The local image tag
+    """
+    if config['backend'] == 'local':
+        return f"{config['endpoint']}/{component}:latest"
+    if config['backend'] == 'sideload':
+        return f"autopipe/{component}:{SIDELOAD_TAG}"
+    return f"{config['username']}/{component}:latest"
+
+
+def image_reference(config: dict, component: str):
+    """
+    Get the image reference used by the pipeline to run a component on the cluster
+
+    :param config: Image delivery configuration, as returned by load_registry_config
+    :param component: Name of the component
+    :return: The image reference pulled by the cluster nodes
+    """
+    if config['backend'] == 'local':
+        return f"{config['pull_endpoint']}/{component}:latest"
+    return image_tag(config, component)
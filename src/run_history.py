@@ -0,0 +1,389 @@
+import os
+import time
+import sqlite3
+import hashlib
+import statistics
+from contextlib import closing
+
+# Local SQLite database where every run of the tool is recorded
+DB_PATH = 'history/runs.db'
+# Environment variable used to share the ID of the current run between the stages of the tool
+RUN_ID_ENV = 'AUTOPIPE_RUN_ID'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    dag_hash TEXT,
+    template_hash TEXT,
+    media_checksum TEXT,
+    pvc_name TEXT,
+    kfp_run_id TEXT,
+    image_bytes INTEGER NOT NULL DEFAULT 0,
+    output_bytes INTEGER NOT NULL DEFAULT 0,
+    exit_status INTEGER
+);
+CREATE TABLE IF NOT EXISTS stages (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    stage TEXT NOT NULL,
+    duration REAL NOT NULL,
+    exit_status INTEGER NOT NULL,
+    skipped INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    component TEXT NOT NULL,
+    duration REAL NOT NULL,
+    cpu REAL,
+    memory REAL
+);
+CREATE TABLE IF NOT EXISTS images (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    component TEXT NOT NULL,
+    digest TEXT NOT NULL
+);
+"""
+# Columns added to the tables after their first version, created in the databases of older versions of the tool
+MIGRATIONS = {
+    'runs': {'image_bytes': 'INTEGER NOT NULL DEFAULT 0', 'output_bytes': 'INTEGER NOT NULL DEFAULT 0'},
+    'stages': {'skipped': 'INTEGER NOT NULL DEFAULT 0'},
+    'tasks': {'cpu': 'REAL', 'memory': 'REAL'}
+}
+
+
+def connect(db_path: str = DB_PATH):
+    """
+    Open the run history database, creating it and its tables if they do not exist yet. The connection is not
+    closed when used as a context manager, which only commits the transaction, so callers wrap it in closing()
+
+    :param db_path: Path to the SQLite database
+    :return: An open sqlite3 connection
+    """
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    connection = sqlite3.connect(db_path)
+    connection.row_factory = sqlite3.Row
+    connection.executescript(SCHEMA)
+    for table, columns in MIGRATIONS.items():
+        existing = {row['name'] for row in connection.execute(f"PRAGMA table_info({table})")}
+        for column, column_type in columns.items():
+            if column not in existing:
+                connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+    connection.commit()
+    return connection
+
+
+def file_checksum(path: str):
+    """
+    Compute the SHA-256 checksum of a file, reading it in chunks to support large media files
+
+    :param path: Path to the file
+    :return: Hex digest of the file, None if the file does not exist
+    """
+    if not path or not os.path.isfile(path):
+        return None
+    sha = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def current_run_id():
+    """
+    Get the ID of the run being executed, shared by autopipe.py with the stages it starts
+
+    :return: The ID of the current run, None if the stage was started outside of autopipe.py
+    """
+    run_id = os.getenv(RUN_ID_ENV)
+    return int(run_id) if run_id else None
+
+
+def start_run(dag_path: str, media_path: str, db_path: str = DB_PATH):
+    """
+    Record the start of a new run
+
+    :param dag_path: Path to the application_dag.yaml configuration file
+    :param media_path: Path to the input media of the pipeline
+    :param db_path: Path to the SQLite database
+    :return: The ID of the new run
+    """
+    with closing(connect(db_path)) as connection, connection:
+        cursor = connection.execute(
+            "INSERT INTO runs (started_at, dag_hash, media_checksum) VALUES (?, ?, ?)",
+            (time.time(), file_checksum(dag_path), file_checksum(media_path))
+        )
+        return cursor.lastrowid
+
+
+def update_run(run_id: int, db_path: str = DB_PATH, **fields):
+    """
+    Update the information of a run, e.g. pvc_name, kfp_run_id or template_hash
+
+    :param run_id: ID of the run to update
+    :param db_path: Path to the SQLite database
+    :param fields: Columns of the runs table to set
+    """
+    if run_id is None or not fields:
+        return
+    assignments = ", ".join(f"{column} = ?" for column in fields)
+    with closing(connect(db_path)) as connection, connection:
+        connection.execute(f"UPDATE runs SET {assignments} WHERE id = ?", (*fields.values(), run_id))
+
+
+def finish_run(run_id: int, exit_status: int, db_path: str = DB_PATH):
+    """
+    Record the end of a run and its exit status
+
+    :param run_id: ID of the run
+    :param exit_status: Exit status of the run, 0 if successful
+    :param db_path: Path to the SQLite database
+    """
+    update_run(run_id, db_path, finished_at=time.time(), exit_status=exit_status)
+
+
+def add_bytes(run_id: int, db_path: str = DB_PATH, **sizes):
+    """
+    Add to the byte counters of a run: image_bytes, the size of the images delivered to the cluster (layers already
+    present in the registry are not uploaded again, so this is an upper bound of the pushed bytes), and output_bytes,
+    the size of the outputs downloaded from the PVC
+
+    :param run_id: ID of the run
+    :param db_path: Path to the SQLite database
+    :param sizes: Counters of the runs table to increase, with the number of bytes to add
+    """
+    if run_id is None or not sizes:
+        return
+    assignments = ", ".join(f"{column} = {column} + ?" for column in sizes)
+    with closing(connect(db_path)) as connection, connection:
+        connection.execute(f"UPDATE runs SET {assignments} WHERE id = ?", (*sizes.values(), run_id))
+
+
+def record_stage(run_id: int, stage: str, duration: float, exit_status: int, db_path: str = DB_PATH):
+    """
+    Record the duration and exit status of a stage of the tool
+
+    :param run_id: ID of the run
+    :param stage: Name of the stage, e.g. 'docker_build'
+    :param duration: Duration of the stage in seconds
+    :param exit_status: Exit status of the stage
+    :param db_path: Path to the SQLite database
+    """
+    if run_id is None:
+        return
+    with closing(connect(db_path)) as connection, connection:
+        connection.execute("INSERT INTO stages (run_id, stage, duration, exit_status) VALUES (?, ?, ?, ?)",
+                           (run_id, stage, duration, exit_status))
+
+
+def skip_stage(run_id: int, stage: str, db_path: str = DB_PATH):
+    """
+    Record a stage of the tool that was not executed, e.g. the image build when resuming a failed run, so that it
+    is not mistaken for a fast stage in the latency statistics
+
+    :param run_id: ID of the run
+    :param stage: Name of the stage, e.g. 'docker_build'
+    :param db_path: Path to the SQLite database
+    """
+    if run_id is None:
+        return
+    with closing(connect(db_path)) as connection, connection:
+        connection.execute("INSERT INTO stages (run_id, stage, duration, exit_status, skipped) VALUES (?, ?, 0, 0, 1)",
+                           (run_id, stage))
+
+
+def record_task(run_id: int, component: str, duration: float, cpu: float = None, memory: float = None,
+                db_path: str = DB_PATH):
+    """
+    Record the duration and resource profile of a component task executed in the Kubeflow pipeline
+
+    :param run_id: ID of the run
+    :param component: Name of the component
+    :param duration: Duration of the task in seconds
+    :param cpu: Peak CPU usage of the task in millicores, None if not profiled
+    :param memory: Peak memory usage of the task in MiB, None if not profiled
+    :param db_path: Path to the SQLite database
+    """
+    if run_id is None:
+        return
+    with closing(connect(db_path)) as connection, connection:
+        connection.execute("INSERT INTO tasks (run_id, component, duration, cpu, memory) VALUES (?, ?, ?, ?, ?)",
+                           (run_id, component, duration, cpu, memory))
+
+
+def record_image(run_id: int, component: str, digest: str, db_path: str = DB_PATH):
+    """
+    Record the digest of the image pushed for a component
+
+    :param run_id: ID of the run
+    :param component: Name of the component
+    :param digest: Digest of the pushed image
+    :param db_path: Path to the SQLite database
+    """
+    if run_id is None:
+        return
+    with closing(connect(db_path)) as connection, connection:
+        connection.execute("INSERT INTO images VALUES (?, ?, ?)", (run_id, component, digest))
+
+
+def list_runs(limit: int = 20, db_path: str = DB_PATH):
+    """
+    List the most recent runs
+
+    :param limit: Maximum number of runs to return
+    :param db_path: Path to the SQLite database
+    :return: List of runs, most recent first
+    """
+    with closing(connect(db_path)) as connection, connection:
+        return connection.execute("SELECT * FROM runs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+
+
+def get_task_profiles(component: str, max_runs: int = 20, db_path: str = DB_PATH):
+    """
+    Get the resource profiles of a component recorded by the most recent runs
+
+    :param component: Name of the component
+    :param max_runs: Maximum number of profiles to return
+    :param db_path: Path to the SQLite database
+    :return: List of (peak cpu millicores, peak memory MiB) tuples, most recent first
+    """
+    with closing(connect(db_path)) as connection, connection:
+        rows = connection.execute(
+            "SELECT cpu, memory FROM tasks WHERE component = ? AND cpu > 0 AND memory > 0 ORDER BY rowid DESC LIMIT ?",
+            (component, max_runs)
+        ).fetchall()
+    return [(row['cpu'], row['memory']) for row in rows]
+
+
+def get_durations(run_id: int, connection: sqlite3.Connection):
+    """
+    Get the stage and task durations of a run, ignoring the skipped stages
+
+    :param run_id: ID of the run
+    :param connection: Open connection to the run history database
+    :return: Dictionary mapping 'stage:<name>' and 'task:<component>' keys to their duration in seconds
+    """
+    durations = {}
+    for row in connection.execute("SELECT stage, duration FROM stages WHERE run_id = ? AND skipped = 0", (run_id,)):
+        durations[f"stage:{row['stage']}"] = row['duration']
+    for row in connection.execute("SELECT component, duration FROM tasks WHERE run_id = ?", (run_id,)):
+        durations[f"task:{row['component']}"] = row['duration']
+    return durations
+
+
+def get_images(run_id: int, connection: sqlite3.Connection):
+    """
+    Get the image digests pushed during a run
+
+    :param run_id: ID of the run
+    :param connection: Open connection to the run history database
+    :return: Dictionary mapping each component to its image digest
+    """
+    rows = connection.execute("SELECT component, digest FROM images WHERE run_id = ?", (run_id,))
+    return {row['component']: row['digest'] for row in rows}
+
+
+def compare_runs(run_a: int, run_b: int, db_path: str = DB_PATH):
+    """
+    Compare the durations and images of two runs
+
+    :param run_a: ID of the baseline run
+    :param run_b: ID of the run to compare against the baseline
+    :param db_path: Path to the SQLite database
+    :return: A tuple containing a list of (key, duration a, duration b) and a list of (component, digest a, digest b)
+             for the images that differ
+    """
+    with closing(connect(db_path)) as connection, connection:
+        durations_a, durations_b = get_durations(run_a, connection), get_durations(run_b, connection)
+        images_a, images_b = get_images(run_a, connection), get_images(run_b, connection)
+
+    durations = [(key, durations_a.get(key), durations_b.get(key)) for key in sorted(set(durations_a) | set(durations_b))]
+    images = [(component, images_a.get(component), images_b.get(component))
+              for component in sorted(set(images_a) | set(images_b))
+              if images_a.get(component) != images_b.get(component)]
+    return durations, images
+
+
+def percentile(values: list, pct: float):
+    """
+    Compute a percentile of a list of values, using linear interpolation between the closest ranks
+
+    :param values: List of numeric values
+    :param pct: Percentile to compute, between 0 and 100
+    :return: The requested percentile
+    """
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def latency_stats(last: int = 20, db_path: str = DB_PATH):
+    """
+    Compute the p50 and p95 latency of each stage and task over the most recent successful runs
+
+    :param last: Number of most recent successful runs to take into account
+    :param db_path: Path to the SQLite database
+    :return: Dictionary mapping 'stage:<name>' and 'task:<component>' keys to a (samples, p50, p95) tuple
+    """
+    samples = {}
+    with closing(connect(db_path)) as connection, connection:
+        runs = connection.execute("SELECT id FROM runs WHERE exit_status = 0 ORDER BY id DESC LIMIT ?", (last,))
+        for run in runs.fetchall():
+            for key, duration in get_durations(run['id'], connection).items():
+                samples.setdefault(key, []).append(duration)
+    return {key: (len(values), percentile(values, 50), percentile(values, 95)) for key, values in samples.items()}
+
+
+def find_regressions(threshold: float = 1.2, window: int = 5, db_path: str = DB_PATH):
+    """
+    Flag the stages and tasks that became slower than the median of the previous successful runs, reporting the
+    component images, DAG configuration or Dockerfile template changes that happened in the same run
+
+    :param threshold: Ratio over the baseline median above which a duration is considered a slowdown
+    :param window: Number of previous successful runs used as baseline
+    :param db_path: Path to the SQLite database
+    :return: List of (run id, key, duration, baseline median, list of changes) tuples
+    """
+    regressions = []
+    with closing(connect(db_path)) as connection, connection:
+        runs = connection.execute("SELECT * FROM runs WHERE exit_status = 0 ORDER BY id").fetchall()
+        durations = {run['id']: get_durations(run['id'], connection) for run in runs}
+        images = {run['id']: get_images(run['id'], connection) for run in runs}
+
+    for index in range(1, len(runs)):
+        run, previous = runs[index], runs[index - 1]
+        baseline_runs = runs[max(0, index - window):index]
+
+        changes = [f"image {component}" for component, digest in images[run['id']].items()
+                   if images[previous['id']].get(component) not in (None, digest)]
+        if run['dag_hash'] != previous['dag_hash']:
+            changes.append("dag configuration")
+        if run['template_hash'] != previous['template_hash']:
+            changes.append("dockerfile template")
+
+        for key, duration in durations[run['id']].items():
+            baseline = [durations[base['id']][key] for base in baseline_runs if key in durations[base['id']]]
+            if not baseline:
+                continue
+            median = statistics.median(baseline)
+            if median > 0 and duration > threshold * median:
+                regressions.append((run['id'], key, duration, median, changes))
+    return regressions
+
+
+def last_failed_pvc(db_path: str = DB_PATH):
+    """
+    Find the PVC kept by the most recent failed run that has not been successfully resumed yet
+
+    :param db_path: Path to the SQLite database
+    :return: The name of the PVC, None if no failed run kept its PVC
+    """
+    with closing(connect(db_path)) as connection, connection:
+        row = connection.execute(
+            "SELECT pvc_name FROM runs WHERE exit_status != 0 AND pvc_name IS NOT NULL "
+            "AND pvc_name NOT IN (SELECT pvc_name FROM runs WHERE exit_status = 0 AND pvc_name IS NOT NULL) "
+            "ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+        return row['pvc_name'] if row else None
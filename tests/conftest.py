@@ -0,0 +1,76 @@
+import os
+import sys
+import json
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The root scripts import 'src.<module>', while the modules in src import each other as 'kube.<module>'
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'src')]
+
+FAKE_COMMAND = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_command.py')
+
+
+class FakeCommand:
+    """
+    A fake command line tool installed on the PATH, answering with the responses registered by the test and
+    recording the arguments of every invocation.
+    """
+    def __init__(self, bin_dir, name: str):
+        self._state_path = os.path.join(bin_dir, f"{name}.json")
+        self._log_path = os.path.join(bin_dir, f"{name}.calls")
+        self._responses = []
+        self._save()
+        open(self._log_path, 'w').close()
+
+        wrapper_path = os.path.join(bin_dir, name)
+        with open(wrapper_path, 'w') as wrapper:
+            wrapper.write(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_COMMAND}" "{self._state_path}" "$@"\n')
+        os.chmod(wrapper_path, 0o755)
+
+    def respond(self, *match, stdout='', stderr='', returncode=0, sleep=0, times=None, files=None):
+        """
+        Register the response given when all the `match` tokens appear in the arguments, earlier responses first
+
+        :param match: Tokens that must appear in the arguments
+        :param stdout: Output written on stdout, either a string or an object serialized to JSON
+        :param stderr: Output written on stderr
+        :param returncode: Exit status of the command
+        :param sleep: Seconds to keep running after writing the output
+        :param times: Number of invocations answered with this response, unlimited if None
+        :param files: Files written into the directory given as last argument, mapping their path to their content
+        """
+        if not isinstance(stdout, str):
+            stdout = json.dumps(stdout)
+        self._responses.append({'match': list(match), 'stdout': stdout, 'stderr': stderr,
+                                'returncode': returncode, 'sleep': sleep, 'times': times, 'files': files or {}})
+        self._save()
+
+    @property
+    def calls(self):
+        """Arguments of every invocation of the command, in order"""
+        return [invocation['args'] for invocation in self._invocations()]
+
+    @property
+    def inputs(self):
+        """Manifests read from stdin by the invocations using '-f -', in order"""
+        return [invocation['stdin'] for invocation in self._invocations() if invocation['stdin'] is not None]
+
+    def _invocations(self):
+        with open(self._log_path, 'r') as log:
+            return [json.loads(line) for line in log]
+
+    def _save(self):
+        with open(self._state_path, 'w') as state_file:
+            json.dump({'responses': self._responses, 'log': self._log_path}, state_file)
+
+
+@pytest.fixture
+def fake_command(tmp_path, monkeypatch):
+    """
+    Factory installing fake command line tools, e.g. kubectl, in front of the real ones on the PATH
+    """
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    return lambda name: FakeCommand(str(bin_dir), name)
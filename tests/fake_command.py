@@ -0,0 +1,45 @@
+"""
+Fake command line tool used by the tests in place of kubectl or python3. It is installed on the PATH by the
+fake_command fixture and answers with the first response of its state file whose tokens all appear in its arguments,
+skipping the responses already used up. Manifests read from stdin with '-f -' are recorded with the arguments, and
+the files of a response are written into the directory given as last argument, e.g. by 'kubectl cp'.
+
+Usage: fake_command.py <state file> [arguments...]
+"""
+import os
+import sys
+import json
+import time
+
+
+def main(state_path: str, args: list):
+    with open(state_path, 'r') as state_file:
+        state = json.load(state_file)
+    stdin = sys.stdin.read() if '-' in args else None
+    with open(state['log'], 'a') as log:
+        log.write(json.dumps({'args': args, 'stdin': stdin}) + '\n')
+
+    for response in state['responses']:
+        if response['times'] != 0 and all(token in args for token in response['match']):
+            if response['times'] is not None:
+                response['times'] -= 1
+                with open(state_path, 'w') as state_file:
+                    json.dump(state, state_file)
+            for file_name, content in response['files'].items():
+                os.makedirs(os.path.dirname(os.path.join(args[-1], file_name)), exist_ok=True)
+                with open(os.path.join(args[-1], file_name), 'w') as file:
+                    file.write(content)
+            sys.stdout.write(response['stdout'])
+            sys.stdout.flush()
+            sys.stderr.write(response['stderr'])
+            sys.stderr.flush()
+            # Simulate a command that keeps running after its output, e.g. 'kubectl logs -f'
+            time.sleep(response['sleep'])
+            return response['returncode']
+
+    sys.stderr.write(f"unexpected command: {args}\n")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1], sys.argv[2:]))
@@ -0,0 +1,104 @@
+import os
+import json
+
+import pytest
+
+import dag_config
+from dag_config import CACHE_SIZE, CACHE_VERSION, DAG_HASH_ENV, DagConfigError, load_dag_config
+
+
+@pytest.fixture
+def dag_file(tmp_path, monkeypatch):
+    # Every test starts without configurations loaded by the previous ones, outside of a run
+    monkeypatch.setattr(dag_config, '_loaded', {})
+    monkeypatch.delenv(DAG_HASH_ENV, raising=False)
+    media_path = tmp_path / 'input.mp4'
+    media_path.write_bytes(b'media')
+    dag_path = tmp_path / 'application_dag.yaml'
+    dag_path.write_text(
+        "System:\n"
+        "  name: app\n"
+        f"  input_media: {media_path}\n"
+        "  components: [' comp-a ', 'comp-b']\n"
+        "  dependencies: [['comp-a', 'comp-b', 1]]\n"
+    )
+    return str(dag_path)
+
+
+def cache_files(cache_dir):
+    return [os.path.join(cache_dir, name) for name in os.listdir(cache_dir)]
+
+
+def test_load_dag_config_caches_by_version(dag_file, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+
+    config = load_dag_config(dag_file, cache_dir)
+
+    assert config.components == ['comp-a', 'comp-b']
+    assert config.downstream == {'comp-a': ['comp-b'], 'comp-b': []}
+    [cache_path] = cache_files(cache_dir)
+    assert cache_path.endswith(f".v{CACHE_VERSION}.json")
+
+
+def test_stages_load_the_configuration_validated_at_the_start_of_the_run(dag_file, tmp_path, monkeypatch, caplog):
+    cache_dir = str(tmp_path / 'cache')
+    validated = load_dag_config(dag_file, cache_dir)
+    monkeypatch.setenv(DAG_HASH_ENV, validated.file_hash)
+    # The file is edited while the run is in progress, and a new stage process loads the configuration
+    with open(dag_file, 'a') as file:
+        file.write("  retries: {comp-b: {num_retries: 2}}\n")
+    monkeypatch.setattr(dag_config, '_loaded', {})
+
+    config = load_dag_config(dag_file, cache_dir)
+
+    assert config == validated
+    assert config.retries == {}
+    assert 'changed since the start of the run' in caplog.text
+
+
+def test_stages_fail_without_the_validated_configuration(dag_file, tmp_path, monkeypatch):
+    monkeypatch.setenv(DAG_HASH_ENV, 'f' * 64)
+
+    with pytest.raises(DagConfigError, match="not found"):
+        load_dag_config(dag_file, str(tmp_path / 'cache'))
+
+
+def test_load_dag_config_keeps_most_recent_cache_entries(dag_file, tmp_path, monkeypatch):
+    cache_dir = tmp_path / 'cache'
+    cache_dir.mkdir()
+    for index in range(CACHE_SIZE + 5):
+        old_entry = cache_dir / f"{index:064d}.v{CACHE_VERSION}.json"
+        old_entry.write_text('{}')
+        os.utime(old_entry, (index, index))
+
+    config = load_dag_config(dag_file, str(cache_dir))
+
+    entries = cache_files(str(cache_dir))
+    assert len(entries) == CACHE_SIZE
+    assert str(cache_dir / f"{config.file_hash}.v{CACHE_VERSION}.json") in entries
+    assert str(cache_dir / f"{0:064d}.v{CACHE_VERSION}.json") not in entries
+
+
+def test_load_dag_config_ignores_corrupted_cache(dag_file, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'cache')
+    load_dag_config(dag_file, cache_dir)
+    [cache_path] = cache_files(cache_dir)
+    with open(cache_path, 'w') as cache_file:
+        cache_file.write('{')
+    monkeypatch.setattr(dag_config, '_loaded', {})
+
+    assert load_dag_config(dag_file, cache_dir).components == ['comp-a', 'comp-b']
+
+
+def test_load_dag_config_rejects_uppercase_names(dag_file, tmp_path):
+    with open(dag_file, 'a') as file:
+        file.write("  retries: {Comp-A: {num_retries: 2}}\n")
+
+    with pytest.raises(DagConfigError, match="lowercase"):
+        load_dag_config(dag_file, str(tmp_path / 'cache'))
+
+
+@pytest.mark.parametrize('name', ['3d-detect', '-detect', 'detect-', 'de--tect'])
+def test_parse_dag_config_rejects_invalid_names(name):
+    with pytest.raises(DagConfigError, match="start with a lowercase letter"):
+        dag_config.parse_dag_config({'System': {'name': 'app', 'input_media': 'input.mp4', 'components': [name]}})
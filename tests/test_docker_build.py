@@ -0,0 +1,43 @@
+import logging
+
+import pytest
+
+from docker_build import check_context_size, is_ignored
+
+TEMPLATE_PATTERNS = ['**/.git', '**/__pycache__', '**/*.py[cod]', '**/.venv']
+
+
+@pytest.mark.parametrize('path, patterns, ignored', [
+    # '*' does not match '/', so a pattern without '**' only applies from the root of the context
+    ('w.bin', ['*.bin'], True),
+    ('models/w.bin', ['*.bin'], False),
+    ('models/w.bin', ['**/*.bin'], True),
+    ('models/w.bin', ['*/*.bin'], True),
+    ('models/large/w.bin', ['*/*.bin'], False),
+    ('models/large/w.bin', ['models'], True),
+    ('models/large/w.bin', ['models/**'], True),
+    ('models/w.bin', ['mod?ls/w.bin'], True),
+    ('models/w.bin', ['**/*.bin', '!models/w.bin'], False),
+    ('.git/config', TEMPLATE_PATTERNS, True),
+    ('src/__pycache__/main.cpython-311.pyc', TEMPLATE_PATTERNS, True),
+    ('src/main.pyc', TEMPLATE_PATTERNS, True),
+    ('src/main.py', TEMPLATE_PATTERNS, False),
+    ('weights/model.pth', TEMPLATE_PATTERNS, False),
+])
+def test_is_ignored_follows_docker_rules(path, patterns, ignored):
+    assert is_ignored(path, patterns) == ignored
+
+
+def test_check_context_size_reports_nested_large_files(tmp_path, caplog):
+    (tmp_path / '.dockerignore').write_text("*.bin\n")
+    (tmp_path / 'models').mkdir()
+    (tmp_path / 'models' / 'w.bin').write_bytes(b'0' * 2000)
+    (tmp_path / 'root.bin').write_bytes(b'0' * 2000)
+    (tmp_path / 'main.py').write_text("print('hello')\n")
+    caplog.set_level(logging.INFO)
+
+    size = check_context_size('comp-a', str(tmp_path), budget=10 ** 9, large_file_size=1000)
+
+    assert size == 2000 + len("print('hello')\n") + len("*.bin\n")
+    warning = [record.getMessage() for record in caplog.records if record.levelno == logging.WARNING][0]
+    assert 'models/w.bin' in warning and 'root.bin' not in warning
@@ -0,0 +1,52 @@
+import sys
+import logging
+
+import pytest
+
+from log_stream import stream_command
+
+
+def test_stream_command_keeps_only_last_lines(caplog):
+    caplog.set_level(logging.INFO)
+    command = [sys.executable, '-c', 'for i in range(500): print(i)']
+
+    returncode, tail = stream_command(command, 'count', tail_lines=10)
+
+    assert returncode == 0
+    assert tail == [str(i) for i in range(490, 500)]
+    streamed = [record.getMessage() for record in caplog.records if record.getMessage().startswith('[count] ')]
+    assert len(streamed) == 500
+    assert streamed[0] == '[count] 0'
+
+
+def test_stream_command_merges_stderr_and_returns_exit_status():
+    command = [sys.executable, '-c', 'import sys; print("out"); sys.stdout.flush(); sys.exit("err")']
+
+    returncode, tail = stream_command(command, 'fail')
+
+    assert returncode == 1
+    assert tail == ['out', 'err']
+
+
+def test_stream_command_missing_binary():
+    returncode, tail = stream_command(['autopipe-missing-binary'], 'missing')
+
+    assert returncode == 127
+    assert len(tail) == 1
+
+
+def test_run_script_reports_short_tail_on_failure(fake_command, caplog):
+    import autopipe
+
+    python3 = fake_command('python3')
+    python3.respond('-i', stdout=''.join(f"line {i}\n" for i in range(100)), returncode=3)
+    caplog.set_level(logging.INFO)
+
+    with pytest.raises(SystemExit) as exit_info:
+        autopipe.run_script('docker_build.py', 'application_dag.yaml')
+
+    assert exit_info.value.code == 3
+    assert python3.calls == [['-u', 'docker_build.py', '-i', 'application_dag.yaml']]
+    error = [record.getMessage() for record in caplog.records if record.levelno == logging.ERROR][-1]
+    reported = error.splitlines()[1:]
+    assert reported == [f"line {i}" for i in range(100 - autopipe.ERROR_TAIL_LINES, 100)]
@@ -0,0 +1,127 @@
+import time
+import fcntl
+import threading
+
+import pytest
+
+from kube.namespaces import KEPT_LABEL, PVC_PREFIX, rank_namespaces, wait_for_namespaces
+from kube.pvc_manager import place_pvc
+
+
+def pvc(name: str, storage: str = '5Gi', kept: bool = False):
+    return {
+        'metadata': {'name': name, 'labels': {KEPT_LABEL: 'true'} if kept else {}},
+        'spec': {'resources': {'requests': {'storage': storage}}}
+    }
+
+
+def quota(hard: dict, used: dict):
+    return {'status': {'hard': hard, 'used': used}}
+
+
+@pytest.fixture
+def namespaces_config(tmp_path):
+    config_path = tmp_path / 'namespaces.yaml'
+    config_path.write_text(
+        "namespaces:\n"
+        "  - name: ns-a\n"
+        "  - name: ns-b\n"
+        "    max_concurrent_runs: 2\n"
+    )
+    return str(config_path)
+
+
+def test_rank_namespaces_skips_exhausted_quota(fake_command, namespaces_config):
+    kubectl = fake_command('kubectl')
+    kubectl.respond('get', 'pvc', 'ns-a', stdout={'items': [pvc(f"{PVC_PREFIX}1")]})
+    kubectl.respond('get', 'resourcequota', 'ns-a', stdout={'items': [
+        quota({'persistentvolumeclaims': '1', 'requests.storage': '10Gi'}, {'persistentvolumeclaims': '1', 'requests.storage': '5Gi'})
+    ]})
+    kubectl.respond('get', 'pvc', 'ns-b', stdout={'items': [pvc('unrelated-pvc')]})
+    kubectl.respond('get', 'resourcequota', 'ns-b', stdout={'items': []})
+
+    assert rank_namespaces('5Gi', namespaces_config) == ['ns-b']
+
+
+def test_rank_namespaces_does_not_count_kept_pvcs_as_runs(fake_command, namespaces_config):
+    kubectl = fake_command('kubectl')
+    kubectl.respond('get', 'pvc', 'ns-a', returncode=1, stderr='forbidden')
+    kubectl.respond('get', 'pvc', 'ns-b', stdout={'items': [
+        pvc(f"{PVC_PREFIX}1"), pvc(f"{PVC_PREFIX}2", kept=True), pvc(f"{PVC_PREFIX}3", kept=True)
+    ]})
+    kubectl.respond('get', 'resourcequota', 'ns-b', stdout={'items': []})
+
+    assert rank_namespaces('5Gi', namespaces_config) == ['ns-b']
+
+
+def test_wait_for_namespaces_returns_when_none_can_be_inspected(fake_command, namespaces_config):
+    kubectl = fake_command('kubectl')
+    kubectl.respond('get', 'pvc', returncode=1, stderr='connection refused')
+
+    start = time.time()
+    ranked = wait_for_namespaces('5Gi', timeout=3600, interval=30, config_path=namespaces_config)
+
+    assert ranked == []
+    assert time.time() - start < 10
+    assert len(kubectl.calls) == 2
+
+
+def test_wait_for_namespaces_waits_while_full(fake_command, namespaces_config):
+    kubectl = fake_command('kubectl')
+    exhausted = {'items': [quota({'persistentvolumeclaims': '2'}, {'persistentvolumeclaims': '2'})]}
+    kubectl.respond('get', 'pvc', stdout={'items': []})
+    kubectl.respond('get', 'resourcequota', stdout=exhausted)
+
+    ranked = wait_for_namespaces('5Gi', timeout=1, interval=0.2, config_path=namespaces_config)
+
+    assert ranked == []
+    assert len([call for call in kubectl.calls if call[:2] == ['get', 'pvc']]) > 2
+
+
+def test_place_pvc_falls_back_when_creation_is_rejected(fake_command, namespaces_config, tmp_path):
+    kubectl = fake_command('kubectl')
+    kubectl.respond('get', 'pvc', stdout={'items': [pvc(f"{PVC_PREFIX}1")]})
+    kubectl.respond('get', 'resourcequota', stdout={'items': []})
+    # A concurrent run exhausted the quota of the namespace with the most headroom after it was ranked
+    kubectl.respond('apply', returncode=1, stderr='exceeded quota: storage', times=1)
+    kubectl.respond('apply', stdout='persistentvolumeclaim created')
+
+    pvc_name, namespace = place_pvc('5Gi', namespaces_config, str(tmp_path / 'placement.lock'))
+
+    assert namespace == 'ns-b'
+    assert pvc_name.startswith(PVC_PREFIX)
+    manifests = kubectl.inputs
+    assert len(manifests) == 2
+    assert 'namespace: ns-a' in manifests[0]
+    assert f"name: {pvc_name}" in manifests[1] and 'namespace: ns-b' in manifests[1]
+
+
+def test_place_pvc_gives_up_when_every_creation_is_rejected(fake_command, namespaces_config, tmp_path):
+    kubectl = fake_command('kubectl')
+    kubectl.respond('get', 'pvc', stdout={'items': []})
+    kubectl.respond('get', 'resourcequota', stdout={'items': []})
+    kubectl.respond('apply', returncode=1, stderr='exceeded quota: storage')
+
+    assert place_pvc('5Gi', namespaces_config, str(tmp_path / 'placement.lock')) == (None, None)
+
+
+def test_place_pvc_waits_for_concurrent_placement(fake_command, namespaces_config, tmp_path):
+    kubectl = fake_command('kubectl')
+    kubectl.respond('get', 'pvc', stdout={'items': []})
+    kubectl.respond('get', 'resourcequota', stdout={'items': []})
+    kubectl.respond('apply', stdout='persistentvolumeclaim created')
+    lock_path = str(tmp_path / 'placement.lock')
+    placed = []
+
+    # Another run started from this machine is ranking the namespaces and creating its PVC
+    with open(lock_path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        thread = threading.Thread(target=lambda: placed.append(place_pvc('5Gi', namespaces_config, lock_path)))
+        thread.start()
+        time.sleep(0.5)
+        assert kubectl.calls == []
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+    thread.join(timeout=10)
+
+    assert placed and placed[0][1] == 'ns-a'
+    assert kubectl.calls[0][:2] == ['get', 'pvc']
@@ -0,0 +1,90 @@
+import yaml
+import pytest
+from kfp import compiler
+
+from dag_config import SAVE_MEDIA, parse_dag_config
+from pipeline_manager import find_pending_components, generate_pipeline
+
+REGISTRY_CONFIG = {'backend': 'dockerhub', 'username': 'user'}
+
+
+@pytest.fixture
+def config():
+    # comp-a feeds comp-b and comp-c, which both feed comp-d
+    return parse_dag_config({'System': {
+        'name': 'app',
+        'input_media': 'media/input.mp4',
+        'components': ['comp-a', 'comp-b', 'comp-c', 'comp-d'],
+        'dependencies': [['comp-a', 'comp-b', 1], ['comp-a', 'comp-c', 1], ['comp-b', 'comp-d', 1], ['comp-c', 'comp-d', 1]]
+    }})
+
+
+def compiled_tasks(config, pending, tmp_path, monkeypatch):
+    # The run history database used to right-size the components is created in the working directory
+    monkeypatch.chdir(tmp_path)
+    pipeline_func = generate_pipeline(REGISTRY_CONFIG, config, pending)
+    compiler.Compiler().compile(pipeline_func=pipeline_func, package_path='pipeline.yaml')
+    with open('pipeline.yaml', 'r') as file:
+        spec = next(yaml.safe_load_all(file))
+    return {name: (sorted(task.get('dependentTasks', [])), task['inputs']['parameters']['input_path']['runtimeValue']['constant'])
+            for name, task in spec['root']['dag']['tasks'].items()}
+
+
+def test_pending_components_include_everything_downstream(config):
+    assert find_pending_components(config, {SAVE_MEDIA, 'comp-a', 'comp-b', 'comp-c'}) == {'comp-d'}
+    assert find_pending_components(config, {SAVE_MEDIA, 'comp-a', 'comp-b'}) == {'comp-c', 'comp-d'}
+    assert find_pending_components(config, {SAVE_MEDIA}) == {'comp-a', 'comp-b', 'comp-c', 'comp-d'}
+    assert find_pending_components(config, set()) == {SAVE_MEDIA, 'comp-a', 'comp-b', 'comp-c', 'comp-d'}
+
+
+def test_pending_components_when_only_save_media_is_missing(config):
+    completed = {'comp-a', 'comp-b', 'comp-c', 'comp-d'}
+
+    assert find_pending_components(config, completed) == {SAVE_MEDIA}
+
+
+def test_generate_pipeline_prunes_completed_components(config, tmp_path, monkeypatch):
+    tasks = compiled_tasks(config, {'comp-b', 'comp-d'}, tmp_path, monkeypatch)
+
+    # The completed upstream components are not executed again, their outputs are read from the PVC
+    assert tasks == {
+        'comp-b': ([], '/mnt/data/comp-a.tar.gz'),
+        'comp-d': (['comp-b'], '/mnt/data/comp-b.tar.gz')
+    }
+
+
+def test_generate_pipeline_without_save_media(config, tmp_path, monkeypatch):
+    tasks = compiled_tasks(config, {'comp-a', 'comp-b', 'comp-c', 'comp-d'}, tmp_path, monkeypatch)
+
+    assert tasks['comp-a'] == ([], '/mnt/data/input.mp4')
+    assert SAVE_MEDIA not in tasks and 'save-media' not in tasks
+    assert tasks['comp-b'][0] == ['comp-a']
+
+
+def test_generate_pipeline_runs_everything_after_save_media(config, tmp_path, monkeypatch):
+    tasks = compiled_tasks(config, None, tmp_path, monkeypatch)
+
+    assert set(tasks) == {'save-media', 'comp-a', 'comp-b', 'comp-c', 'comp-d'}
+    assert tasks['comp-a'][0] == ['save-media']
+
+
+def test_generate_pipeline_waits_for_every_upstream_component(config, tmp_path, monkeypatch):
+    tasks = compiled_tasks(config, None, tmp_path, monkeypatch)
+
+    assert tasks['comp-d'] == (['comp-b', 'comp-c'], '/mnt/data/comp-b.tar.gz')
+    assert tasks['comp-c'] == (['comp-a'], '/mnt/data/comp-a.tar.gz')
+
+
+def test_generate_pipeline_with_dependencies_out_of_order(tmp_path, monkeypatch):
+    config = parse_dag_config({'System': {
+        'name': 'app',
+        'input_media': 'media/input.mp4',
+        'components': ['comp-a', 'comp-b', 'comp-c'],
+        'dependencies': [['comp-b', 'comp-c', 1], ['comp-a', 'comp-b', 1]]
+    }})
+
+    tasks = compiled_tasks(config, None, tmp_path, monkeypatch)
+
+    assert tasks['comp-a'] == (['save-media'], '/mnt/data/input.mp4')
+    assert tasks['comp-b'] == (['comp-a'], '/mnt/data/comp-a.tar.gz')
+    assert tasks['comp-c'] == (['comp-b'], '/mnt/data/comp-b.tar.gz')
@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+from kfp import dsl
+
+from kube import pipeline_run as pipeline_run_module
+from kube.pipeline_run import TIMEOUT_STATE, pipeline_run
+
+
+@dsl.container_component
+def noop():
+    return dsl.ContainerSpec(image='busybox', command=['true'])
+
+
+@dsl.pipeline(name="noop")
+def noop_pipeline(pvc_name: str):
+    noop()
+
+
+class FakeClient:
+    def __init__(self, wait_error=None):
+        self.wait_error = wait_error
+        self.terminated = []
+
+    def set_user_namespace(self, namespace):
+        pass
+
+    def create_run_from_pipeline_package(self, **kwargs):
+        return SimpleNamespace(run_id='run-1')
+
+    def wait_for_run_completion(self, run_id, timeout, sleep_duration):
+        if self.wait_error:
+            raise self.wait_error
+        return SimpleNamespace(state='SUCCEEDED')
+
+    def terminate_run(self, run_id):
+        self.terminated.append(run_id)
+
+
+class Monitor:
+    def __init__(self):
+        self.events = []
+
+    def start(self, run_id):
+        self.events.append(('start', run_id))
+
+    def stop(self):
+        self.events.append(('stop',))
+
+
+def use_client(monkeypatch, client):
+    manager = SimpleNamespace(create_kfp_client=lambda: client)
+    monkeypatch.setattr(pipeline_run_module, 'KFPClientManager', lambda **kwargs: manager)
+
+
+def test_pipeline_run_returns_final_state(monkeypatch, tmp_path):
+    use_client(monkeypatch, FakeClient())
+    monitor = Monitor()
+
+    result = pipeline_run('pvc', noop_pipeline, str(tmp_path / 'pipeline.yaml'), monitors=[monitor])
+
+    assert result == ('run-1', 'SUCCEEDED')
+    assert monitor.events == [('start', 'run-1'), ('stop',)]
+
+
+def test_pipeline_run_terminates_run_on_timeout(monkeypatch, tmp_path):
+    client = FakeClient(TimeoutError('Run timeout'))
+    use_client(monkeypatch, client)
+    monitor = Monitor()
+
+    result = pipeline_run('pvc', noop_pipeline, str(tmp_path / 'pipeline.yaml'), monitors=[monitor], timeout=1)
+
+    assert result == ('run-1', TIMEOUT_STATE)
+    assert client.terminated == ['run-1']
+    assert monitor.events[-1] == ('stop',)
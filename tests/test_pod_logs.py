@@ -0,0 +1,79 @@
+import time
+import logging
+
+from kube.pod_logs import PodLogTailer
+
+
+def task_pod(name: str, component: str, state: dict):
+    return {
+        'metadata': {'name': name},
+        'spec': {'containers': [{'name': 'main', 'image': f"user/{component}:latest"}]},
+        'status': {'containerStatuses': [{'name': 'main', 'state': state}]}
+    }
+
+
+def wait_until(condition, timeout: float = 10):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def test_tailer_follows_started_pods_and_terminates_on_stop(fake_command, caplog):
+    kubectl = fake_command('kubectl')
+    pods = [
+        task_pod('pod-a', 'comp-a', {'running': {'startedAt': '2024-01-01T00:00:00Z'}}),
+        task_pod('pod-b', 'comp-b', {'waiting': {'reason': 'ContainerCreating'}})
+    ]
+    kubectl.respond('get', 'pods', stdout={'items': pods})
+    # 'kubectl logs -f' keeps running after the lines already written, until the pod terminates
+    kubectl.respond('logs', 'pod-a', stdout="hello\nworld\n", sleep=60)
+    caplog.set_level(logging.INFO)
+
+    tailer = PodLogTailer('team-1', {'comp-a', 'comp-b'}, interval=0.1)
+    tailer.start('run-1')
+    messages = lambda: [record.getMessage() for record in caplog.records]
+    assert wait_until(lambda: '[comp-a] world' in messages())
+    processes = [process for process, _ in tailer._followers.values()]
+
+    start = time.time()
+    tailer.stop()
+
+    assert time.time() - start < 5
+    assert '[comp-a] hello' in messages()
+    assert all(process.poll() is not None for process in processes)
+    assert tailer._followers == {}
+    logs_calls = [call for call in kubectl.calls if call[0] == 'logs']
+    assert logs_calls == [['logs', '-f', 'pod-a', '-c', 'main', '-n', 'team-1']]
+
+
+def test_tailer_follows_each_pod_once(fake_command, caplog):
+    kubectl = fake_command('kubectl')
+    pods = [task_pod('pod-a', 'comp-a', {'terminated': {'startedAt': '2024-01-01T00:00:00Z'}})]
+    kubectl.respond('get', 'pods', stdout={'items': pods})
+    kubectl.respond('logs', 'pod-a', stdout="done\n")
+    caplog.set_level(logging.INFO)
+
+    tailer = PodLogTailer('team-1', {'comp-a'}, interval=0.1)
+    tailer.start('run-1')
+    assert wait_until(lambda: len([call for call in kubectl.calls if call[:2] == ['get', 'pods']]) >= 3)
+    tailer.stop()
+
+    assert len([call for call in kubectl.calls if call[0] == 'logs']) == 1
+    assert '[comp-a] done' in [record.getMessage() for record in caplog.records]
+
+
+def test_tailer_ignores_pods_of_other_images(fake_command):
+    kubectl = fake_command('kubectl')
+    # The KFP driver pods of the run also have a main container
+    pods = [task_pod('driver', 'kfp-driver', {'running': {'startedAt': '2024-01-01T00:00:00Z'}})]
+    kubectl.respond('get', 'pods', stdout={'items': pods})
+
+    tailer = PodLogTailer('team-1', {'comp-a'}, interval=0.1)
+    tailer.start('run-1')
+    assert wait_until(lambda: len([call for call in kubectl.calls if call[:2] == ['get', 'pods']]) >= 3)
+    tailer.stop()
+
+    assert [call for call in kubectl.calls if call[0] == 'logs'] == []
@@ -0,0 +1,28 @@
+from kube.pvc_manager import download_from_pvc
+
+
+def test_download_from_pvc_measures_overwritten_outputs(fake_command, tmp_path):
+    kubectl = fake_command('kubectl')
+    kubectl.respond('apply')
+    kubectl.respond('wait')
+    kubectl.respond('delete', 'pod')
+    kubectl.respond('cp', files={'comp-a.tar.gz': 'a' * 100, 'comp-a/log.txt': 'b' * 20})
+    local_path = tmp_path / 'output'
+    local_path.mkdir()
+    # Outputs of a previous run with the same names, overwritten by the download
+    (local_path / 'comp-a.tar.gz').write_text('x' * 100)
+
+    assert download_from_pvc('mypipe-pvc-1', str(local_path), 'team-1') == 120
+    assert (local_path / 'comp-a.tar.gz').read_text() == 'a' * 100
+    assert (local_path / 'comp-a' / 'log.txt').read_text() == 'b' * 20
+    assert ['delete', 'pod', 'access-mypipe-pvc-1', '-n', 'team-1'] in kubectl.calls
+
+
+def test_download_from_pvc_copy_failure(fake_command, tmp_path):
+    kubectl = fake_command('kubectl')
+    kubectl.respond('apply')
+    kubectl.respond('wait')
+    kubectl.respond('delete', 'pod')
+    kubectl.respond('cp', returncode=1, stderr='error: pod not found')
+
+    assert download_from_pvc('mypipe-pvc-1', str(tmp_path), 'team-1') is None
@@ -0,0 +1,34 @@
+import time
+
+from kube.resource_profiler import ResourceProfiler, get_pod_component
+
+
+def task_pod(name: str, image: str):
+    return {
+        'metadata': {'name': name},
+        'spec': {'containers': [{'name': 'main', 'image': image}]},
+        'status': {'containerStatuses': [{'name': 'main', 'state': {'terminated': {
+            'startedAt': '2024-01-01T00:00:00Z', 'finishedAt': '2024-01-01T00:01:00Z'}}}]}
+    }
+
+
+def test_get_pod_component_only_returns_pipeline_components():
+    assert get_pod_component(task_pod('a', 'localhost:5000/comp-a:local'), {'comp-a'}) == 'comp-a'
+    assert get_pod_component(task_pod('d', 'gcr.io/ml-pipeline/kfp-driver@sha256:abc'), {'comp-a'}) is None
+    assert get_pod_component(task_pod('d', 'gcr.io/ml-pipeline/kfp-driver:2.0'), None) == 'kfp-driver'
+
+
+def test_profiler_ignores_driver_pods(fake_command):
+    kubectl = fake_command('kubectl')
+    pods = [task_pod('pod-a', 'user/comp-a:latest'), task_pod('pod-driver', 'gcr.io/ml-pipeline/kfp-driver:2.0')]
+    kubectl.respond('get', 'pods', stdout={'items': pods})
+    kubectl.respond('top', 'pod', stdout="pod-a main 250m 300Mi\npod-driver main 10m 20Mi\n")
+
+    profiler = ResourceProfiler('team-1', {'comp-a', 'save-media'}, interval=0.1)
+    profiler.start('run-1')
+    deadline = time.time() + 10
+    while not profiler.profiles.get('comp-a', {}).get('cpu') and time.time() < deadline:
+        time.sleep(0.05)
+    profiler.stop()
+
+    assert profiler.profiles == {'comp-a': {'cpu': 250.0, 'memory': 300.0, 'duration': 60.0}}